@@ -1,24 +1,39 @@
-from flask import Flask, render_template, request, jsonify
-import sqlite3 
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
+import base64
+import json
+import os
+import socket
+import uuid
 from flask_socketio import SocketIO, emit
 import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
 import time
 from datetime import datetime
 
 from config import DynamicConfig 
+from database.change_watcher import ChangeWatcher
 from database.db_manager import DatabaseManager
+from database.log_writer import FilterLogWriter
 from models.naive_bayes import NaiveBayesFilter
 from models.llm_analyzer import LLMAnalyzer
+from models.online_trainer import OnlineTrainer
+from models.preprocessing import preprocess_text
+from models.verdict_cache import VerdictCache
+from models.http_pool import ProviderSessionPool
 
 app = Flask(__name__)
 
-socketio = SocketIO(app, cors_allowed_origins="*")
+# Chạy nhiều process (serve.py): emit từ worker đi qua message queue (vd. redis://) tới front end
+socketio = SocketIO(app, cors_allowed_origins="*", message_queue=os.environ.get('SOCKETIO_MESSAGE_QUEUE'))
 
 # 3. Khởi tạo DatabaseManager TRƯỚC
 # Giả sử DATABASE_URL được định nghĩa tĩnh hoặc từ biến môi trường
 # Vì trong code của bạn không có, mình sẽ tạm hardcode nó ở đây.
 DATABASE_URL = 'database/spam_filter.db' 
 db = DatabaseManager(DATABASE_URL)
+# Log các bước filter được gom và ghi theo batch thay vì commit từng dòng
+log_writer = FilterLogWriter(db)
 
 # 4. Khởi tạo DynamicConfig bằng cách truyền db manager vào
 # và lưu nó vào app context để các route có thể dùng
@@ -26,17 +41,106 @@ app.dynamic_config = DynamicConfig(db)
 
 # 5. Khởi tạo các component khác sử dụng config động
 nb_filter = NaiveBayesFilter() # Giả sử nb_filter cũng cần config
-llm_analyzer = LLMAnalyzer(app.dynamic_config) # Giả sử llm_analyzer cũng cần config
+# Học tăng dần từ message admin đã review (partial_fit, swap model nguyên tử)
+online_trainer = OnlineTrainer(
+    nb_filter, db, min_batch=max(1, int(app.dynamic_config.get('online_training_min_batch', 5)))
+)
+# Verdict cache: LRU + TTL trong bộ nhớ, tầng bền vững trong SQLite dùng chung
+verdict_cache = VerdictCache(db_manager=db)
+# Session keep-alive theo provider; read timeout dùng setting max_processing_time
+http_pool = ProviderSessionPool(
+    pool_maxsize=max(1, int(app.dynamic_config.get('llm_max_concurrency', 4))),
+    connect_timeout=float(app.dynamic_config.get('llm_connect_timeout', 5)),
+    read_timeout=float(app.dynamic_config.get('max_processing_time', 30)),
+    max_retries=int(app.dynamic_config.get('llm_max_retries', 2))
+)
+llm_analyzer = LLMAnalyzer(app.dynamic_config, verdict_cache=verdict_cache, http_pool=http_pool) # Giả sử llm_analyzer cũng cần config
+
+# Keyword rule của mock/fallback analysis lưu trong DB (mặc định do migration nạp), sửa được khi đang chạy
+_keyword_rules_version = None
+_keyword_rules_lock = threading.Lock()
+
+def refresh_keyword_rules(force: bool = False) -> bool:
+    """Build lại keyword index nếu bảng keyword_rules đã đổi (kể cả do process khác sửa)"""
+    global _keyword_rules_version
+    with _keyword_rules_lock:
+        version = db.get_change_version('keyword_rules')
+        if not force and version == _keyword_rules_version:
+            return False
+        keyword_count = llm_analyzer.reload_keyword_rules(db.get_keyword_rules(enabled_only=True))
+        _keyword_rules_version = version
+    print(f"🔤 Keyword rules reloaded: {keyword_count} keywords")
+    return True
+
+refresh_keyword_rules(force=True)
+
+# Báo thay đổi giữa các process: PRAGMA data_version + bảng change_versions, không poll từng bảng
+change_watcher = ChangeWatcher(db)
+change_watcher.subscribe('settings', app.dynamic_config.refresh)
+change_watcher.subscribe('keyword_rules', refresh_keyword_rules)
+# Model mới do process khác train (online trainer hoặc train lại toàn bộ) → con trỏ CURRENT đổi
+change_watcher.watch_file(os.path.join(nb_filter.model_path, nb_filter.artifact.CURRENT_FILE), nb_filter.reload_if_changed)
 
 # Background processor
 class MessageProcessor:
-    def __init__(self):
+    MAX_BATCH_SIZE = 256  # Số message tối đa xử lý trong một lần drain queue
+    LEASE_SECONDS = 300  # Thời hạn lease khi claim message
+    MAINTENANCE_INTERVAL = 30  # Chu kỳ (giây) thu hồi lease hết hạn
+    STATS_RECONCILE_INTERVAL = 600  # Chu kỳ (giây) đối soát counter thống kê
+    DB_CLAIM_BATCH_SIZE = 32  # poll_database: batch nhỏ để chia đều burst cho nhiều worker process
+    DB_POLL_INTERVAL = 0.05  # poll_database: chu kỳ (giây) kiểm tra PRAGMA data_version khi không có message
+    
+    def __init__(self, worker_id: str = None, poll_database: bool = False, run_background_jobs: bool = True):
+        """
+        poll_database: worker process riêng (serve.py workers) → claim message pending thẳng từ DB
+            thay vì chờ id từ queue trong process (do /api/send_message đưa vào)
+        run_background_jobs: chạy online trainer và đối soát counter (chỉ cần một process)
+        """
         self.running = False
         self.thread = None
+        self.poll_database = poll_database
+        self.run_background_jobs = run_background_jobs
+        # Connection riêng để đọc PRAGMA data_version (chỉ đổi khi connection khác commit)
+        self._watch_conn = None
+        # worker_id duy nhất trên mọi host/process để claim message trong DB dùng chung
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._last_maintenance = 0.0
+        self._last_stats_reconcile = time.time()
+        # Queue trong process: /api/send_message đẩy message_id vào để đánh thức processor ngay
+        self.queue = queue.Queue()
+        self.llm_executor = None
+        # Message đã claim và đang chờ/chạy trong LLM stage (cần gia hạn lease)
+        self._llm_inflight = set()
+        self._llm_inflight_lock = threading.Lock()
+        # Message cần LLM trong batch NB hiện tại, gửi đi sau khi hết batch
+        self._pending_escalations = []
     
     def start(self):
         if not self.running:
             self.running = True
+            log_writer.start()
+            # Settings/keyword rule/model do process khác sửa được nạp lại trong thread nền, không trên hot path
+            change_watcher.start()
+            # Health check chạy nền, message không bao giờ phải chờ probe
+            if app.dynamic_config.get('enable_health_check', True):
+                llm_analyzer.start_health_probing(
+                    interval=float(app.dynamic_config.get('llm_health_check_interval', 60))
+                )
+            # Stage LLM riêng: message cần LLM chờ I/O ở đây, không chặn luồng Naive Bayes
+            self.llm_executor = ThreadPoolExecutor(
+                max_workers=max(1, int(app.dynamic_config.get('llm_max_concurrency', 4))),
+                thread_name_prefix='llm-stage'
+            )
+            if self.run_background_jobs and app.dynamic_config.get('online_training_enabled', True):
+                online_trainer.start(
+                    interval=float(app.dynamic_config.get('online_training_interval', 300))
+                )
+            if self.poll_database:
+                # Message pending (kể cả của worker đã chết) được claim trực tiếp từ DB
+                db.reclaim_expired_leases()
+                self._watch_conn = db._create_connection()
+            else:
+                self._recover_pending_messages()
             self.thread = threading.Thread(target=self._process_loop)
             self.thread.daemon = True
             self.thread.start()
@@ -44,36 +148,165 @@ class MessageProcessor:
     
     def stop(self):
         self.running = False
+        # Đánh thức vòng lặp đang chờ trên queue
+        self.queue.put(None)
         if self.thread:
             self.thread.join()
+        if self.llm_executor:
+            # Chờ các request LLM đang chạy, hủy phần còn xếp hàng
+            self.llm_executor.shutdown(wait=True, cancel_futures=True)
+            with self._llm_inflight_lock:
+                cancelled_ids = list(self._llm_inflight)
+                self._llm_inflight.clear()
+            db.release_messages(self.worker_id, cancelled_ids)
+        llm_analyzer.stop_health_probing()
+        online_trainer.stop()
+        change_watcher.stop()
+        if self._watch_conn:
+            self._watch_conn.close()
+            self._watch_conn = None
+        # Ghi nốt log còn trong buffer
+        log_writer.stop()
         print("Message processor stopped")
     
+    def enqueue(self, message_id: int):
+        """Đưa message mới vào queue xử lý (processor không chạy trong process này → worker process tự claim từ DB)"""
+        if self.running and not self.poll_database:
+            self.queue.put(message_id)
+    
+    def _recover_pending_messages(self):
+        """Crash recovery: nạp lại các message còn pending trong DB khi khởi động"""
+        db.reclaim_expired_leases()
+        pending_messages = db.get_pending_messages()
+        for message in pending_messages:
+            self.queue.put(message['id'])
+        
+        if pending_messages:
+            print(f"♻️ Recovered {len(pending_messages)} pending messages")
+    
+    def _drain_queue(self) -> list:
+        """Chờ message đầu tiên rồi lấy thêm các message đang chờ sẵn (tối đa MAX_BATCH_SIZE)"""
+        message_ids = []
+        
+        try:
+            message_id = self.queue.get(timeout=1)
+        except queue.Empty:
+            return message_ids
+        
+        while True:
+            if message_id is not None:
+                message_ids.append(message_id)
+            if len(message_ids) >= self.MAX_BATCH_SIZE:
+                break
+            try:
+                message_id = self.queue.get_nowait()
+            except queue.Empty:
+                break
+        
+        return message_ids
+    
+    def _claim_from_database(self) -> list:
+        """poll_database: claim các message pending cũ nhất; không có thì chờ tới khi DB có commit mới (tối đa 1 giây)"""
+        claimed_messages = db.claim_messages(
+            self.worker_id,
+            limit=self.DB_CLAIM_BATCH_SIZE,
+            lease_seconds=self.LEASE_SECONDS
+        )
+        if claimed_messages:
+            return claimed_messages
+        
+        # data_version đọc từ shared memory của WAL → chờ rảnh gần như không tốn query, không giữ write lock
+        data_version = self._watch_conn.execute("PRAGMA data_version").fetchone()[0]
+        deadline = time.time() + 1
+        while self.running and time.time() < deadline:
+            time.sleep(self.DB_POLL_INTERVAL)
+            if self._watch_conn.execute("PRAGMA data_version").fetchone()[0] != data_version:
+                break
+        return []
+    
+    def _run_maintenance(self):
+        """Gia hạn lease cho message đang chờ LLM, thu hồi lease hết hạn, định kỳ đối soát counter"""
+        now = time.time()
+        if now - self._last_maintenance < self.MAINTENANCE_INTERVAL:
+            return
+        self._last_maintenance = now
+        
+        with self._llm_inflight_lock:
+            inflight_ids = list(self._llm_inflight)
+        db.renew_leases(self.worker_id, inflight_ids, self.LEASE_SECONDS)
+        
+        for message_id in db.reclaim_expired_leases():
+            if not self.poll_database:
+                self.queue.put(message_id)
+        
+        if self.run_background_jobs and now - self._last_stats_reconcile >= self.STATS_RECONCILE_INTERVAL:
+            self._last_stats_reconcile = now
+            db.reconcile_message_counters()
+            db.purge_expired_verdicts(verdict_cache.ttl_seconds)
+            
     def _process_loop(self):
         """Vòng lặp xử lý messages"""
         while self.running:
             try:
-                pending_messages = db.get_pending_messages()
+                self._run_maintenance()
+                
+                if self.poll_database:
+                    claimed_messages = self._claim_from_database()
+                else:
+                    message_ids = self._drain_queue()
+                    if not message_ids:
+                        continue
+                    
+                    # Claim trước khi xử lý → worker khác không xử lý trùng
+                    claimed_messages = db.claim_messages(
+                        self.worker_id,
+                        limit=self.MAX_BATCH_SIZE,
+                        lease_seconds=self.LEASE_SECONDS,
+                        message_ids=message_ids
+                    )
+                if not claimed_messages:
+                    continue
+                
+                # Một snapshot config cho cả batch → mọi message cùng batch dùng chung bộ ngưỡng
+                config = app.dynamic_config.snapshot()
+                
+                # Tiền xử lý một lần, dùng lại cho Naive Bayes, verdict cache và keyword matcher
+                normalized_texts = [preprocess_text(message['content']) for message in claimed_messages]
                 
-                for message in pending_messages:
+                # Chạy Naive Bayes một lần cho cả batch thay vì từng message
+                nb_results = nb_filter.predict_batch(normalized_texts, preprocessed=True)
+                
+                for index, (message, nb_result, normalized_text) in enumerate(
+                        zip(claimed_messages, nb_results, normalized_texts)):
                     if not self.running:
+                        # Đang dừng → trả phần chưa xử lý về pending cho worker khác
+                        db.release_messages(self.worker_id, [m['id'] for m in claimed_messages[index:]])
                         break
                     
-                    self._process_message(message)
-                    
-                    # Emit update to clients
-                    socketio.emit('message_processed', {
-                        'message_id': message['id'],
-                        'status': 'processed'
-                    })
+                    # Message chuyển sang LLM stage sẽ emit khi có kết quả
+                    if self._process_message(message, nb_result, normalized_text, config):
+                        self._notify_processed(message['id'])
                 
-                time.sleep(2)  # Kiểm tra mỗi 2 giây
+                self._flush_escalations(config)
                 
             except Exception as e:
                 print(f"Error in process loop: {e}")
                 time.sleep(5)
     
-    def _process_message(self, message):
-        """Xử lý một message qua pipeline filter"""
+    def _notify_processed(self, message_id: int):
+        # Emit update to clients
+        socketio.emit('message_processed', {
+            'message_id': message_id,
+            'status': 'processed'
+        })
+    
+    def _process_message(self, message, nb_result=None, normalized_text=None, config=None) -> bool:
+        """Xử lý một message qua pipeline filter
+        nb_result: (prediction, probabilities) đã tính sẵn từ predict_batch
+        normalized_text: preprocess_text(content) đã tính sẵn
+        config: snapshot settings của batch (mặc định lấy snapshot hiện tại)
+        Returns: True nếu đã có quyết định cuối, False nếu message được chuyển sang LLM stage
+        """
         
         message_id = message['id']
         content = message['content']
@@ -81,111 +314,205 @@ class MessageProcessor:
 
         try:
             # Step 1: Naive Bayes Classification
-            prediction, probabilities = nb_filter.predict(content)
+            if nb_result is None:
+                nb_result = nb_filter.predict(content)
+            prediction, probabilities = nb_result
             nb_classification = nb_filter.get_classification_name(prediction)
             max_prob = max(probabilities)
             
-            db.log_filter_step(
+            log_writer.log(
                 message_id, 
                 'naive_bayes', 
                 nb_classification,
                 f'Prediction: {prediction}, Max_prob: {max_prob:.3f}, All_probs: {probabilities}'
             )
             
-            # IMPROVED DECISION LOGIC
-            if prediction == 0 and max_prob >= app.dynamic_config.NAIVE_BAYES_THRESHOLD:
-                # Legitimate với confidence cao → Pass
-                final_status = 'approved'
-                final_classification = 'legitimate'
-                db.log_filter_step(message_id, 'decision', 'approved', f'NB high confidence legitimate: {max_prob:.3f}')
-                
-            elif prediction == 2 and max_prob >= app.dynamic_config.NAIVE_BAYES_THRESHOLD:
-                # Spam với confidence cao → Block
-                final_status = 'blocked'
-                final_classification = 'spam'
-                db.log_filter_step(message_id, 'decision', 'blocked', f'NB high confidence spam: {max_prob:.3f}')
-                
-            elif prediction == 0 and max_prob >= app.dynamic_config.SUSPICIOUS_THRESHOLD:
-                # Legitimate với confidence trung bình → Pass luôn
-                final_status = 'approved'
-                final_classification = 'legitimate'
-                db.log_filter_step(message_id, 'decision', 'approved', f'NB medium confidence legitimate: {max_prob:.3f}')
+            decision = self.nb_decision(prediction, max_prob, config or app.dynamic_config.snapshot())
+            if decision is None:
+                # Chỉ gửi LLM khi thực sự cần thiết (very low confidence)
+                log_writer.log(message_id, 'llm_analysis', 'started', f'Very low NB confidence ({max_prob:.3f}), escalating to LLM')
+                if normalized_text is None:
+                    normalized_text = preprocess_text(content)
+                self._escalate_to_llm(message_id, content, normalized_text, prediction, max_prob)
+                return False
+            
+            final_status, final_classification, reason = decision
+            log_writer.log(message_id, 'decision', final_status, reason)
+            
+            # Update message status
+            if not db.update_message_status(message_id, final_status, final_classification, max_prob,
+                                            decided_by='naive_bayes', worker_id=self.worker_id):
+                self._report_lost_lease(message_id)
+                return True
+            
+            print(f"✅ Processed message {message_id}: {final_status} ({final_classification}) - NB: {max_prob:.3f}")
+            
+        except Exception as e:
+            print(f"❌ Error processing message {message_id}: {e}")
+            log_writer.log(message_id, 'error', 'failed', str(e))
+            # Conservative fallback - approve unknown errors
+            db.update_message_status(message_id, 'approved', 'legitimate', decided_by='error_fallback',
+                                     worker_id=self.worker_id)
+        
+        return True
+    
+    def _report_lost_lease(self, message_id: int):
+        # Lease hết hạn và message đã bị worker khác claim lại → kết quả của owner mới được giữ nguyên
+        print(f"⚠️ Lease on message {message_id} lost, result discarded")
+        log_writer.log(message_id, 'decision', 'discarded', f'Lease lost by worker {self.worker_id}')
+    
+    @staticmethod
+    def nb_decision(prediction: int, max_prob: float, config):
+        """
+        Quyết định chỉ dựa vào Naive Bayes (dùng chung cho processor và /api/classify)
+        config: snapshot settings (app.dynamic_config.snapshot()) do caller lấy một lần
+        Returns: (status, classification, lý do) hoặc None nếu confidence quá thấp, cần LLM
+        """
+        # Cả hai ngưỡng từ cùng một snapshot → không lẫn version khi settings đổi giữa chừng
+        nb_threshold = config.get('naive_bayes_threshold', 0.7)
+        suspicious_threshold = config.get('suspicious_threshold', 0.5)
+        
+        # IMPROVED DECISION LOGIC
+        if prediction == 0 and max_prob >= nb_threshold:
+            # Legitimate với confidence cao → Pass
+            return 'approved', 'legitimate', f'NB high confidence legitimate: {max_prob:.3f}'
+        if prediction == 2 and max_prob >= nb_threshold:
+            # Spam với confidence cao → Block
+            return 'blocked', 'spam', f'NB high confidence spam: {max_prob:.3f}'
+        if prediction == 0 and max_prob >= suspicious_threshold:
+            # Legitimate với confidence trung bình → Pass luôn
+            return 'approved', 'legitimate', f'NB medium confidence legitimate: {max_prob:.3f}'
+        if prediction == 2 and max_prob >= suspicious_threshold:
+            # Spam với confidence trung bình → Block luôn
+            return 'blocked', 'spam', f'NB medium confidence spam: {max_prob:.3f}'
+        return None
+    
+    def _escalate_to_llm(self, message_id: int, content: str, normalized_text: str,
+                         prediction: int, max_prob: float):
+        """Đánh dấu message cần LLM; gom lại và gửi theo batch sau khi xử lý xong batch NB"""
+        with self._llm_inflight_lock:
+            self._llm_inflight.add(message_id)
+        self._pending_escalations.append((message_id, content, normalized_text, prediction, max_prob))
+    
+    def _flush_escalations(self, config=None):
+        """Chia các message cần LLM thành nhóm llm_batch_size, mỗi nhóm là một task của LLM stage"""
+        escalations, self._pending_escalations = self._pending_escalations, []
+        if not escalations:
+            return
+        
+        batch_size = max(1, int((config or app.dynamic_config.snapshot()).get('llm_batch_size', 5)))
+        for start in range(0, len(escalations), batch_size):
+            self.llm_executor.submit(self._run_llm_stage, escalations[start:start + batch_size])
+    
+    def _run_llm_stage(self, escalations: list):
+        """Phân tích một nhóm message bằng LLM và ra quyết định cuối (chạy trong thread pool của LLM stage)
+        escalations: [(message_id, content, normalized_text, prediction, max_prob), ...]
+        """
+        llm_results = None
+        llm_error = None
+        try:
+            print(f"📡 Calling LLM for messages {[e[0] for e in escalations]}")
+            llm_results = llm_analyzer.analyze_messages(
+                [e[1] for e in escalations], normalized_texts=[e[2] for e in escalations]
+            )
+        except Exception as e:
+            llm_error = e
+        
+        for index, (message_id, content, _, prediction, max_prob) in enumerate(escalations):
+            try:
+                self._apply_llm_decision(
+                    message_id, prediction, max_prob,
+                    llm_results[index] if llm_results else None, llm_error
+                )
+            finally:
+                with self._llm_inflight_lock:
+                    self._llm_inflight.discard(message_id)
+            
+            self._notify_processed(message_id)
+    
+    def _apply_llm_decision(self, message_id: int, prediction: int, max_prob: float,
+                            llm_result: dict = None, llm_error: Exception = None):
+        """Quyết định cuối cho message đã qua LLM (hoặc LLM lỗi → dựa vào NB)"""
+        try:
+            try:
+                if llm_error is not None:
+                    raise llm_error
                 
-            elif prediction == 2 and max_prob >= app.dynamic_config.SUSPICIOUS_THRESHOLD:
-                # Spam với confidence trung bình → Block luôn
-                final_status = 'blocked'
-                final_classification = 'spam'
-                db.log_filter_step(message_id, 'decision', 'blocked', f'NB medium confidence spam: {max_prob:.3f}')
+                print(f"✅ LLM Response for {message_id}: {llm_result}")
                 
-            else:
-                # Chỉ gửi LLM khi thực sự cần thiết (very low confidence)
-                db.log_filter_step(message_id, 'llm_analysis', 'started', f'Very low NB confidence ({max_prob:.3f}), escalating to LLM')
+                log_writer.log(
+                    message_id, 
+                    'llm_analysis', 
+                    llm_result['classification'],
+                    f"Confidence: {llm_result['confidence']:.3f}, Reason: {llm_result['reason'][:100]}"
+                )
                 
-                try:
-                    print(f"📡 Calling LLM for message {message_id}")
-                    llm_result = llm_analyzer.analyze_message(content)
-                    print(f"✅ LLM Response for {message_id}: {llm_result}")
-                    
-                    db.log_filter_step(
-                        message_id, 
-                        'llm_analysis', 
-                        llm_result['classification'],
-                        f"Confidence: {llm_result['confidence']:.3f}, Reason: {llm_result['reason'][:100]}"
-                    )
-                    
-                    # LLM decision với fallback an toàn hơn
-                    if llm_result['confidence'] >= 0.7:  # Chỉ tin LLM khi confidence cao
-                        if llm_result['is_spam']:
-                            final_status = 'blocked'
-                            final_classification = 'spam'
-                            db.log_filter_step(message_id, 'decision', 'blocked', 'LLM high confidence spam')
-                        else:
-                            final_status = 'approved'
-                            final_classification = 'legitimate'
-                            db.log_filter_step(message_id, 'decision', 'approved', 'LLM high confidence legitimate')
+                # LLM decision với fallback an toàn hơn
+                if llm_result['confidence'] >= 0.7:  # Chỉ tin LLM khi confidence cao
+                    # Provider down/lỗi → analyzer trả kết quả mock theo keyword, không phải verdict của LLM
+                    if llm_result.get('analysis_method') == 'enhanced_mock':
+                        decided_by = 'keyword_fallback'
                     else:
-                        # LLM không chắc chắn → dựa vào NB prediction
-                        if prediction == 2:  # NB says spam
-                            final_status = 'flagged'
-                            final_classification = 'suspicious'
-                            db.log_filter_step(message_id, 'decision', 'flagged', 'LLM uncertain + NB spam → flagged')
-                        else:  # NB says legitimate or suspicious
-                            final_status = 'approved'
-                            final_classification = 'legitimate'
-                            db.log_filter_step(message_id, 'decision', 'approved', 'LLM uncertain + NB non-spam → approved')
-                            
-                except Exception as llm_error:
-                    print(f"❌ LLM Error for message {message_id}: {llm_error}")
-                    print(f"❌ Error type: {type(llm_error)}")
-                    print(f"❌ Error details: {str(llm_error)}")
-                    # LLM failed → fallback dựa vào NB
-                    db.log_filter_step(message_id, 'llm_analysis', 'failed', str(llm_error))
-                    
+                        decided_by = 'llm'
+                    if llm_result['is_spam']:
+                        final_status = 'blocked'
+                        final_classification = 'spam'
+                        log_writer.log(message_id, 'decision', 'blocked', 'LLM high confidence spam')
+                    else:
+                        final_status = 'approved'
+                        final_classification = 'legitimate'
+                        log_writer.log(message_id, 'decision', 'approved', 'LLM high confidence legitimate')
+                else:
+                    # LLM không chắc chắn → dựa vào NB prediction
+                    decided_by = 'naive_bayes_fallback'
                     if prediction == 2:  # NB says spam
-                        final_status = 'flagged'  # Không block cứng
+                        final_status = 'flagged'
                         final_classification = 'suspicious'
-                        db.log_filter_step(message_id, 'decision', 'flagged', 'LLM failed + NB spam → flagged for review')
-                    else:
-                        final_status = 'approved'  # Ưu tiên cho user experience
+                        log_writer.log(message_id, 'decision', 'flagged', 'LLM uncertain + NB spam → flagged')
+                    else:  # NB says legitimate or suspicious
+                        final_status = 'approved'
                         final_classification = 'legitimate'
-                        db.log_filter_step(message_id, 'decision', 'approved', 'LLM failed + NB non-spam → approved')
+                        log_writer.log(message_id, 'decision', 'approved', 'LLM uncertain + NB non-spam → approved')
+                        
+            except Exception as llm_error:
+                print(f"❌ LLM Error for message {message_id}: {llm_error}")
+                print(f"❌ Error type: {type(llm_error)}")
+                print(f"❌ Error details: {str(llm_error)}")
+                # LLM failed → fallback dựa vào NB
+                llm_result = None
+                decided_by = 'naive_bayes_fallback'
+                log_writer.log(message_id, 'llm_analysis', 'failed', str(llm_error))
+                
+                if prediction == 2:  # NB says spam
+                    final_status = 'flagged'  # Không block cứng
+                    final_classification = 'suspicious'
+                    log_writer.log(message_id, 'decision', 'flagged', 'LLM failed + NB spam → flagged for review')
+                else:
+                    final_status = 'approved'  # Ưu tiên cho user experience
+                    final_classification = 'legitimate'
+                    log_writer.log(message_id, 'decision', 'approved', 'LLM failed + NB non-spam → approved')
             
             # Update message status
-            db.update_message_status(
+            if not db.update_message_status(
                 message_id,
                 final_status,
                 final_classification,
                 max_prob,
-                llm_result.get('confidence') if 'llm_result' in locals() else None
-            )
+                llm_result.get('confidence') if llm_result else None,
+                decided_by=decided_by,
+                worker_id=self.worker_id
+            ):
+                self._report_lost_lease(message_id)
+                return
             
             print(f"✅ Processed message {message_id}: {final_status} ({final_classification}) - NB: {max_prob:.3f}")
             
         except Exception as e:
             print(f"❌ Error processing message {message_id}: {e}")
-            db.log_filter_step(message_id, 'error', 'failed', str(e))
+            log_writer.log(message_id, 'error', 'failed', str(e))
             # Conservative fallback - approve unknown errors
-            db.update_message_status(message_id, 'approved', 'legitimate')
+            db.update_message_status(message_id, 'approved', 'legitimate', decided_by='error_fallback',
+                                     worker_id=self.worker_id)
 
 # Khởi tạo processor
 processor = MessageProcessor()
@@ -207,6 +534,7 @@ def send_message():
     
     # Thêm vào queue
     message_id = db.add_message(content, sender)
+    processor.enqueue(message_id)
     
     return jsonify({
         'success': True,
@@ -214,66 +542,220 @@ def send_message():
         'message': 'Message added to queue for processing'
     })
 
+def _parse_bulk_messages(max_messages: int) -> list:
+    """
+    Đọc body của /api/send_messages thành [(content, sender), ...]
+    Body: JSON array [{content, sender}, ...] hoặc NDJSON (Content-Type: application/x-ndjson), mỗi dòng một object
+    Raises: ValueError (kèm vị trí item lỗi) nếu body sai định dạng hoặc vượt max_messages
+    """
+    if request.mimetype == 'application/x-ndjson':
+        # Đọc từng dòng từ stream, không dựng cả body thành một cây JSON
+        def read_lines():
+            for index, line in enumerate(line for line in request.stream if line.strip()):
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    raise ValueError(f'Item {index}: invalid JSON')
+        items = read_lines()
+    else:
+        items = request.get_json(silent=True)
+        if not isinstance(items, list):
+            raise ValueError('Body must be a JSON array or NDJSON')
+
+    messages = []
+    for index, item in enumerate(items):
+        if index >= max_messages:
+            raise ValueError(f'Too many messages (max {max_messages})')
+        if not isinstance(item, dict):
+            raise ValueError(f'Item {index}: must be an object')
+        content = str(item.get('content') or '').strip()
+        if not content:
+            raise ValueError(f'Item {index}: message content is required')
+        sender = item.get('sender') or 'Anonymous'
+        if not isinstance(sender, str):
+            raise ValueError(f'Item {index}: sender must be a string')
+        messages.append((content, sender))
+
+    return messages
+
+@app.route('/api/send_messages', methods=['POST'])
+def send_messages():
+    """API nhận nhiều message một lần; cả request ghi trong một transaction (tất cả hoặc không message nào)"""
+    config = app.dynamic_config.snapshot()
+    batch_size = max(1, int(config.get('bulk_ingest_batch_size', 500)))
+    max_messages = max(1, int(config.get('bulk_ingest_max_messages', 10000)))
+
+    try:
+        messages = _parse_bulk_messages(max_messages)
+    except ValueError as e:
+        # json.JSONDecodeError cũng là ValueError
+        return jsonify({'error': str(e)}), 400
+
+    if not messages:
+        return jsonify({'error': 'At least one message is required'}), 400
+
+    message_ids = db.add_messages(messages, batch_size)
+
+    for message_id in message_ids:
+        processor.enqueue(message_id)
+
+    return jsonify({
+        'success': True,
+        'message_ids': message_ids,
+        'count': len(message_ids),
+        'message': f'{len(message_ids)} messages added to queue for processing'
+    })
+
+CLASSIFY_POLL_INTERVAL = 0.05  # Giây giữa hai lần đọc status khi /api/classify chờ kết quả LLM
+
+@app.route('/api/classify', methods=['POST'])
+def classify_message():
+    """
+    Phân loại inline bằng Naive Bayes, không qua queue
+    Body: {content, sender, wait (bool, mặc định false), timeout (giây, tối đa max_processing_time)}
+    NB đủ confidence → trả quyết định ngay. Message mơ hồ được đưa vào LLM stage như /api/send_message;
+    wait=true → chờ kết quả tối đa timeout giây, hết giờ trả pending=true kèm message_id để tra sau
+    """
+    start_time = time.perf_counter()
+    data = request.get_json(silent=True) or {}
+    content = str(data.get('content') or '').strip()
+    sender = data.get('sender') or 'Anonymous'
+
+    if not content:
+        return jsonify({'error': 'Message content is required'}), 400
+
+    config = app.dynamic_config.snapshot()
+    try:
+        max_wait = float(config.get('max_processing_time', 30))
+        timeout = min(max(float(data.get('timeout', 5)), 0), max_wait)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'timeout must be a number'}), 400
+
+    prediction, probabilities = nb_filter.predict(content)
+    max_prob = max(probabilities)
+    decision = MessageProcessor.nb_decision(prediction, max_prob, config)
+
+    if decision is not None:
+        status, classification, reason = decision
+        message_id = db.add_message(content, sender, status, classification, max_prob, decided_by='naive_bayes')
+        log_writer.log(
+            message_id,
+            'naive_bayes',
+            nb_filter.get_classification_name(prediction),
+            f'Prediction: {prediction}, Max_prob: {max_prob:.3f}, All_probs: {probabilities}'
+        )
+        log_writer.log(message_id, 'decision', status, f'{reason} (inline classify)')
+        return jsonify({
+            'message_id': message_id,
+            'pending': False,
+            'status': status,
+            'classification': classification,
+            'naive_bayes_score': max_prob,
+            'llm_score': None,
+            'decided_by': 'naive_bayes',
+            'latency_ms': round((time.perf_counter() - start_time) * 1000, 2)
+        })
+
+    # Mơ hồ → LLM stage (processor trong process này hoặc worker process claim từ DB)
+    message_id = db.add_message(content, sender)
+    processor.enqueue(message_id)
+
+    message = None
+    if data.get('wait'):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            time.sleep(CLASSIFY_POLL_INTERVAL)
+            message = db.get_message(message_id)
+            if message and message['status'] not in ('pending', 'processing'):
+                break
+
+    if not message or message['status'] in ('pending', 'processing'):
+        return jsonify({
+            'message_id': message_id,
+            'pending': True,
+            'status': 'pending',
+            'naive_bayes_score': max_prob,
+            'latency_ms': round((time.perf_counter() - start_time) * 1000, 2)
+        }), 202
+
+    return jsonify({
+        'message_id': message_id,
+        'pending': False,
+        'status': message['status'],
+        'classification': message['classification'],
+        'naive_bayes_score': message['naive_bayes_score'],
+        'llm_score': message['llm_score'],
+        # Processor ghi lại bước đã quyết định: LLM, keyword fallback, hay NB (worker chạy lại NB / LLM lỗi)
+        'decided_by': message['decided_by'],
+        'latency_ms': round((time.perf_counter() - start_time) * 1000, 2)
+    })
+
+# Phân trang keyset theo (created_at, id)
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+def _encode_cursor(message: dict) -> str:
+    """Cursor dạng opaque từ (created_at, id) của dòng cuối trang"""
+    raw = json.dumps([message['created_at'], message['id']])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def _decode_cursor(token: str) -> tuple:
+    created_at, message_id = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    return created_at, int(message_id)
+
+def _paginated_response(fetch_page):
+    """
+    Trả về một trang JSON (cursor trang kế tiếp trong header X-Next-Cursor)
+    hoặc stream toàn bộ kết quả dạng NDJSON khi format=ndjson
+    fetch_page(limit, before) -> list message
+    """
+    try:
+        page_size = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        cursor = request.args.get('cursor')
+        before = _decode_cursor(cursor) if cursor else None
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+    
+    if request.args.get('format') == 'ndjson':
+        def generate(before):
+            # Mỗi lần chỉ giữ một trang trong bộ nhớ
+            while True:
+                page = fetch_page(page_size, before)
+                for message in page:
+                    yield json.dumps(message, ensure_ascii=False) + '\n'
+                if len(page) < page_size:
+                    return
+                before = (page[-1]['created_at'], page[-1]['id'])
+        
+        return Response(stream_with_context(generate(before)), mimetype='application/x-ndjson')
+    
+    page = fetch_page(page_size, before)
+    response = jsonify(page)
+    if len(page) == page_size:
+        response.headers['X-Next-Cursor'] = _encode_cursor(page[-1])
+    return response
+
 @app.route('/api/inbox')
 def get_inbox():
-    """Lấy messages trong inbox"""
+    """Lấy messages trong inbox (phân trang: limit, cursor, format=ndjson)"""
     status = request.args.get('status', 'approved')
-    messages = db.get_inbox_messages(status)
-    return jsonify(messages)
+    return _paginated_response(
+        lambda limit, before: db.get_inbox_messages(status, limit=limit, before=before)
+    )
 
 @app.route('/api/admin/messages')
 def get_all_messages():
-    """Admin: xem tất cả messages và logs"""
-    messages = db.get_all_messages_with_logs()
-    return jsonify(messages)
+    """Admin: xem tất cả messages và logs (phân trang: limit, cursor, format=ndjson)"""
+    return _paginated_response(
+        lambda limit, before: db.get_all_messages_with_logs(limit=limit, before=before)
+    )
 
 # Thêm vào app.py sau route '/api/admin/messages'
 
 @app.route('/api/stats')
 def get_stats():
-    """Thống kê tổng quan từ database"""
-    # FIX: Sử dụng biến DATABASE_URL đã định nghĩa ở đầu file app.py
-    conn = sqlite3.connect(DATABASE_URL) 
-    cursor = conn.cursor()
-    
-    # Đếm theo classification
-    cursor.execute("""
-        SELECT 
-            classification,
-            COUNT(*) as count
-        FROM messages 
-        WHERE status != 'pending'
-        GROUP BY classification
-    """)
-    
-    classification_counts = dict(cursor.fetchall())
-    
-    # Đếm theo status
-    cursor.execute("""
-        SELECT 
-            status,
-            COUNT(*) as count
-        FROM messages 
-        GROUP BY status
-    """)
-    
-    status_counts = dict(cursor.fetchall())
-    
-    # Tổng số đã xử lý
-    cursor.execute("SELECT COUNT(*) FROM messages WHERE status != 'pending'")
-    total_processed = cursor.fetchone()[0]
-    
-    conn.close()
-    
-    return jsonify({
-        'total_processed': total_processed,
-        'legitimate': classification_counts.get('legitimate', 0),
-        'suspicious': classification_counts.get('suspicious', 0),
-        'spam': classification_counts.get('spam', 0),
-        'blocked': status_counts.get('blocked', 0),
-        'flagged': status_counts.get('flagged', 0),
-        'approved': status_counts.get('approved', 0)
-    })
+    """Thống kê tổng quan (counter được trigger cập nhật, không quét bảng messages)"""
+    return jsonify(db.get_message_stats())
 
 # Thêm vào app.py
 @app.route('/api/settings')
@@ -301,10 +783,10 @@ def update_settings():
         if current is not None:
             db.update_setting(key, value)
             updated_keys.append(key)
-            
-            # Clear config cache
-            if hasattr(app, 'dynamic_config'):
-                app.dynamic_config.clear_cache()
+    
+    # Nạp lại snapshot một lần sau khi ghi xong; process khác thấy version mới ở lần kiểm tra kế tiếp
+    if updated_keys and hasattr(app, 'dynamic_config'):
+        app.dynamic_config.refresh(force=True)
     
     return jsonify({
         'success': True,
@@ -312,6 +794,95 @@ def update_settings():
         'message': f'Updated {len(updated_keys)} settings'
     })
 
+@app.route('/api/rules')
+def get_keyword_rules():
+    """Lấy keyword rule của mock/fallback analysis theo rule_set"""
+    return jsonify(db.get_keyword_rules())
+
+@app.route('/api/rules', methods=['POST'])
+def update_keyword_rules():
+    """
+    Thêm/cập nhật keyword rule, index được build lại ngay
+    Body: một rule hoặc danh sách rule {rule_set, keyword, weight, enabled}
+    """
+    data = request.json
+    rules = data if isinstance(data, list) else [data]
+    
+    for rule in rules:
+        if not isinstance(rule, dict) or rule.get('rule_set') not in db.KEYWORD_RULE_SETS:
+            return jsonify({'error': f'rule_set must be one of {list(db.KEYWORD_RULE_SETS)}'}), 400
+        if not str(rule.get('keyword', '')).strip():
+            return jsonify({'error': 'keyword is required'}), 400
+        try:
+            weight = float(rule.get('weight'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'weight must be a number'}), 400
+        if not 0 <= weight <= 1:
+            return jsonify({'error': 'weight must be between 0 and 1'}), 400
+        try:
+            db.parse_rule_enabled(rule.get('enabled', True))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    
+    updated = db.upsert_keyword_rules(rules)
+    refresh_keyword_rules(force=True)
+    
+    return jsonify({
+        'success': True,
+        'updated': updated,
+        'message': f'Updated {updated} keyword rules'
+    })
+
+@app.route('/api/rules/<int:rule_id>', methods=['DELETE'])
+def delete_keyword_rule(rule_id):
+    """Xóa một keyword rule"""
+    if not db.delete_keyword_rule(rule_id):
+        return jsonify({'error': 'Rule not found'}), 404
+    
+    refresh_keyword_rules(force=True)
+    return jsonify({'success': True, 'deleted_id': rule_id})
+
+@app.route('/api/messages/<int:message_id>/review', methods=['POST'])
+def review_message(message_id):
+    """Admin gán nhãn cuối cho message; nhãn được học vào model ở lần cập nhật tiếp theo"""
+    label = (request.json or {}).get('label')
+    if label not in db.REVIEW_STATUS:
+        return jsonify({'error': f'label must be one of {list(db.REVIEW_STATUS)}'}), 400
+    
+    if not db.review_message(message_id, label):
+        return jsonify({'error': 'Message not found or not processed yet'}), 404
+    
+    log_writer.log(message_id, 'review', label, f'Admin review → {db.REVIEW_STATUS[label]}')
+    return jsonify({
+        'success': True,
+        'message_id': message_id,
+        'label': label,
+        'status': db.REVIEW_STATUS[label]
+    })
+
+@app.route('/api/model')
+def get_model_info():
+    """Version model Naive Bayes đang dùng và trạng thái học tăng dần"""
+    meta = nb_filter.model_meta or {}
+    return jsonify({
+        'version': meta.get('version'),
+        'created_at': meta.get('created_at'),
+        'training_data_sha256': meta.get('training_data_sha256'),
+        'incremental_samples': meta.get('incremental_samples', 0),
+        'fast_scorer': nb_filter.scorer is not None,
+        'online_training': online_trainer.get_stats()
+    })
+
+@app.route('/api/model/train', methods=['POST'])
+def train_model_from_reviews():
+    """Học ngay các review đang chờ, không đợi chu kỳ của online trainer"""
+    trained = online_trainer.run_once(min_batch=1)
+    return jsonify({
+        'success': True,
+        'trained': trained,
+        'version': (nb_filter.model_meta or {}).get('version')
+    })
+
 @app.route('/api/llm/health')
 def check_llm_health():
     """Kiểm tra health của LLM providers"""
@@ -328,9 +899,16 @@ def check_llm_health():
     return jsonify({
         'current_provider': provider,
         'health': health_result,
-        'error_summary': error_summary
+        'error_summary': error_summary,
+        'routing': llm_analyzer.get_routing_stats(),
+        'verdict_cache': llm_analyzer.get_cache_stats()
     })
 
+@app.route('/api/llm/cache')
+def get_llm_cache_stats():
+    """Thống kê hit/miss của verdict cache LLM"""
+    return jsonify(llm_analyzer.get_cache_stats())
+
 @app.route('/api/llm/test', methods=['POST'])
 def test_llm_connection():
     """Test LLM connection với message mẫu"""
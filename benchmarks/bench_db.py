@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark throughput của DatabaseManager (messages/giây)
+
+Mỗi message đi qua đúng chuỗi thao tác DB của pipeline:
+add_message → claim_messages → 3 bước filter_logs → update_message_status
+
+Chạy: python benchmarks/bench_db.py --messages 2000 [--buffered-logs] [--bulk-insert] [--baseline]
+--baseline: đường cũ trước khi có connection pool (mở connection mỗi lần gọi, rollback journal)
+để so sánh trước/sau trên cùng máy
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db_manager import DatabaseManager
+from database.log_writer import FilterLogWriter
+
+
+class BaselineDatabaseManager(DatabaseManager):
+    """Như DatabaseManager nhưng mỗi lần gọi mở connection mới rồi đóng, journal mặc định (DELETE)"""
+    
+    def init_database(self):
+        # journal_mode lưu trong file DB → đặt lại phòng khi --db-path trỏ tới file đã bật WAL
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+        super().init_database()
+    
+    def _create_connection(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=self.BUSY_TIMEOUT, check_same_thread=False)
+    
+    @contextmanager
+    def _connection(self):
+        conn = self._create_connection()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+def run_pipeline(db: DatabaseManager, n_messages: int, batch_size: int,
+                 buffered_logs: bool = False, bulk_insert: bool = False) -> float:
+    """Chạy workload và trả về số messages/giây"""
+    log_writer = FilterLogWriter(db)
+    if buffered_logs:
+        log_writer.start()
+    
+    start = time.perf_counter()
+    
+    processed = 0
+    while processed < n_messages:
+        current_batch = min(batch_size, n_messages - processed)
+        if bulk_insert:
+            # Như /api/send_messages: cả batch trong một transaction
+            message_ids = db.add_messages([
+                (f"Benchmark message {processed + i}", 'bench') for i in range(current_batch)
+            ])
+        else:
+            message_ids = [
+                db.add_message(f"Benchmark message {processed + i}", 'bench')
+                for i in range(current_batch)
+            ]
+        
+        for message in db.claim_messages('bench-worker', limit=current_batch, message_ids=message_ids):
+            log_writer.log(message['id'], 'naive_bayes', 'legitimate', 'Prediction: 0, Max_prob: 0.900')
+            log_writer.log(message['id'], 'decision', 'approved', 'NB high confidence legitimate: 0.900')
+            log_writer.log(message['id'], 'notify', 'sent')
+            db.update_message_status(message['id'], 'approved', 'legitimate', 0.9, worker_id='bench-worker')
+        
+        processed += current_batch
+    
+    # Tính cả thời gian ghi nốt buffer
+    log_writer.stop()
+    elapsed = time.perf_counter() - start
+    return n_messages / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark DatabaseManager throughput')
+    parser.add_argument('--messages', type=int, default=2000, help='Số message cần xử lý')
+    parser.add_argument('--batch-size', type=int, default=64, help='Số message mỗi lần claim')
+    parser.add_argument('--db-path', default=None, help='File SQLite (mặc định: file tạm)')
+    parser.add_argument('--buffered-logs', action='store_true', help='Ghi filter_logs qua FilterLogWriter')
+    parser.add_argument('--bulk-insert', action='store_true', help='Thêm message bằng add_messages (executemany)')
+    parser.add_argument('--baseline', action='store_true',
+                        help='Connection mới mỗi lần gọi, rollback journal (trước khi có pool/WAL)')
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = args.db_path or os.path.join(tmp_dir, 'bench.db')
+        db = (BaselineDatabaseManager if args.baseline else DatabaseManager)(db_path)
+        
+        throughput = run_pipeline(db, args.messages, args.batch_size, args.buffered_logs, args.bulk_insert)
+        
+        if hasattr(db, 'close'):
+            db.close()
+    
+    mode = 'baseline connect-per-call' if args.baseline else 'pooled WAL'
+    mode += ', buffered logs' if args.buffered_logs else ', direct logs'
+    if args.bulk_insert:
+        mode += ', bulk insert'
+    print(f"📊 {args.messages} messages, batch {args.batch_size}, {mode}: {throughput:,.0f} messages/giây")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark + kiểm tra parity của NBScorer so với sklearn Pipeline
+
+- Parity: xác suất của NBScorer phải trùng predict_proba trên toàn bộ training data
+- Latency: µs/message khi gọi từng message (hot path) và thời gian cho cả batch
+
+Chạy: python benchmarks/bench_nb_scorer.py --iterations 2000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.naive_bayes import NaiveBayesFilter
+from models.nb_scorer import NBScorer
+
+
+def per_message_us(predict, texts: list, iterations: int) -> float:
+    start = time.perf_counter()
+    for i in range(iterations):
+        predict(texts[i % len(texts)])
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark NBScorer vs sklearn')
+    parser.add_argument('--iterations', type=int, default=2000, help='Số lần predict từng message')
+    parser.add_argument('--batch-size', type=int, default=256, help='Kích thước batch để so sánh')
+    args = parser.parse_args()
+
+    nb_filter = NaiveBayesFilter()
+    scorer = NBScorer.from_pipeline(nb_filter.pipeline)
+
+    with open(nb_filter.training_data_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    texts = [nb_filter.preprocess_text(text) for label in data for text in data[label]]
+
+    difference = scorer.max_abs_difference(nb_filter.pipeline, texts)
+    predictions_match = all(
+        scorer.predict(text)[0] == int(label)
+        for text, label in zip(texts, nb_filter.pipeline.predict(texts))
+    )
+    print(f"🔍 Parity trên {len(texts)} message: max |Δp| = {difference:.2e}, "
+          f"prediction {'khớp' if predictions_match else 'KHÔNG khớp'}")
+
+    sklearn_us = per_message_us(lambda text: nb_filter.pipeline.predict_proba([text]), texts, args.iterations)
+    scorer_us = per_message_us(scorer.predict, texts, args.iterations)
+    print(f"⏱️ Từng message: sklearn {sklearn_us:.1f} µs | NBScorer {scorer_us:.1f} µs")
+
+    batch = (texts * (args.batch_size // len(texts) + 1))[:args.batch_size]
+    start = time.perf_counter()
+    nb_filter.pipeline.predict_proba(batch)
+    sklearn_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    for text in batch:
+        scorer.predict(text)
+    scorer_ms = (time.perf_counter() - start) * 1000
+    print(f"📦 Batch {args.batch_size}: sklearn {sklearn_ms:.2f} ms | NBScorer {scorer_ms:.2f} ms")
+
+    sys.exit(0 if difference <= NaiveBayesFilter.PARITY_TOLERANCE and predictions_match else 1)
+
+
+if __name__ == '__main__':
+    main()
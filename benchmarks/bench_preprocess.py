@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark tiền xử lý văn bản (ký tự/giây)
+
+So sánh cách cũ (hai lần re.sub với pattern chưa compile) với preprocess_text dùng chung,
+trên input NFC, NFD (tiếng Việt tổ hợp) và có bỏ dấu.
+
+Chạy: python benchmarks/bench_preprocess.py --messages 20000
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+import unicodedata
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.preprocessing import preprocess_text
+
+WORDS = ['Chúc', 'mừng', 'bạn', 'đã', 'trúng', 'giải', 'thưởng', '100.000.000đ!', 'Click', 'link:',
+         'http://bit.ly/abc', 'để', 'nhận', 'quà', 'tài', 'khoản', 'bị', 'khóa,', 'mã', 'OTP', 'của',
+         'anh/chị', 'là', '123456.', 'Xin', 'chào,', 'báo', 'cáo', 'dự', 'án', 'tuần', 'này', 'meeting']
+
+
+def legacy_preprocess(text: str) -> str:
+    text = text.lower()
+    text = re.sub(r'[^\w\s]', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+
+def measure(preprocess, messages: list) -> float:
+    total_chars = sum(len(message) for message in messages)
+    start = time.perf_counter()
+    for message in messages:
+        preprocess(message)
+    return total_chars / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark text preprocessing')
+    parser.add_argument('--messages', type=int, default=20000, help='Số message cần xử lý')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    nfc_messages = [
+        ' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 40)))
+        for _ in range(args.messages)
+    ]
+    nfd_messages = [unicodedata.normalize('NFD', message) for message in nfc_messages]
+
+    # Với input NFC kết quả phải giống hệt cách cũ (model đã train không bị lệch vocabulary)
+    mismatches = sum(legacy_preprocess(m) != preprocess_text(m) for m in nfc_messages)
+    # Input NFD: cách cũ tách rời dấu thành token riêng, cách mới đưa về cùng token với NFC
+    nfd_split = sum(legacy_preprocess(d) != legacy_preprocess(c) for c, d in zip(nfc_messages, nfd_messages))
+    nfd_fixed = sum(preprocess_text(d) == preprocess_text(c) for c, d in zip(nfc_messages, nfd_messages))
+
+    cases = [
+        ('legacy re.sub, NFC', legacy_preprocess, nfc_messages),
+        ('preprocess_text, NFC', preprocess_text, nfc_messages),
+        ('preprocess_text, NFD', preprocess_text, nfd_messages),
+        ('preprocess_text, fold', lambda message: preprocess_text(message, fold=True), nfc_messages),
+    ]
+    for name, preprocess, messages in cases:
+        print(f"{name:<24} {measure(preprocess, messages) / 1e6:>8.2f} M chars/giây")
+
+    print(f"📊 NFC mismatches vs legacy: {mismatches} | NFD tách token (legacy): {nfd_split}/{args.messages}"
+          f" | NFD khớp NFC (mới): {nfd_fixed}/{args.messages}")
+
+
+if __name__ == '__main__':
+    main()
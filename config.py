@@ -1,69 +1,70 @@
-import os
-import time
+import threading
+from types import MappingProxyType
 
 
 class DynamicConfig:
+    """
+    Settings đọc từ DB dưới dạng một snapshot bất biến
+    Toàn bộ settings được nạp bằng một query; reader chỉ tra dict trong bộ nhớ, không chạm SQLite.
+    Snapshot mới được dựng khi version settings trong DB đổi và thay bằng một phép gán (swap nguyên tử).
+    Thay đổi từ process khác được báo qua ChangeWatcher (subscribe 'settings' → refresh).
+    """
+
     def __init__(self, db_manager):
         self.db = db_manager
-        self._cache = {}
-        self._cache_time = {}
-        self.CACHE_DURATION = 300  # 5 phút
-    
+        self._snapshot = MappingProxyType({})
+        self.version = None
+        self._refresh_lock = threading.Lock()
+        self.refresh(force=True)
+
     def get(self, key: str, default=None):
-        """Lấy config với caching"""
-        now = time.time()
-        
-        # Check cache
-        if (key in self._cache and 
-            key in self._cache_time and 
-            now - self._cache_time[key] < self.CACHE_DURATION):
-            return self._cache[key]
-        
-        # Get from DB
-        value = self.db.get_setting(key, default)
-        
-        # Cache result
-        self._cache[key] = value
-        self._cache_time[key] = now
-        
-        return value
-    
+        """Lấy config từ snapshot hiện tại"""
+        return self._snapshot.get(key, default)
+
+    def snapshot(self):
+        """Snapshot hiện tại (chỉ đọc); đọc nhiều key từ cùng một snapshot để luôn nhất quán"""
+        return self._snapshot
+
+    def refresh(self, force: bool = False) -> bool:
+        """Nạp lại snapshot nếu version settings trong DB đã đổi. Returns: True nếu đã nạp lại"""
+        with self._refresh_lock:
+            if not force and self.db.get_change_version('settings') == self.version:
+                return False
+            version, settings = self.db.load_settings_snapshot()
+            self._snapshot = MappingProxyType(settings)
+            self.version = version
+        return True
+
     def update(self, key: str, value):
-        """Update config và clear cache"""
+        """Update config và nạp lại snapshot ngay trong process này"""
         self.db.update_setting(key, value)
-        
-        # Clear cache for this key
-        if key in self._cache:
-            del self._cache[key]
-        if key in self._cache_time:
-            del self._cache_time[key]
-    
+        self.refresh(force=True)
+
     def clear_cache(self):
-        """Clear toàn bộ cache"""
-        self._cache = {}
-        self._cache_time = {}
-    
+        """Giữ tương thích: nạp lại snapshot từ DB"""
+        self.refresh(force=True)
+
     # Properties để tương thích với code cũ
     @property
     def LLM_PROVIDER(self):
         return self.get('llm_provider', 'openai')
-    
+
     @property
     def OPENAI_API_KEY(self):
         return self.get('openai_api_key', '')
-    
+
     @property
     def GROQ_API_KEY(self):
         return self.get('groq_api_key', '')
-        
+
     @property
     def OPENROUTER_API_KEY(self):
         return self.get('openrouter_api_key', '')
-    
+
     @property
     def NAIVE_BAYES_THRESHOLD(self):
         return self.get('naive_bayes_threshold', 0.7)
-    
-    @property 
+
+    @property
     def SUSPICIOUS_THRESHOLD(self):
-        return self.get('suspicious_threshold', 0.5)
\ No newline at end of file
+        return self.get('suspicious_threshold', 0.5)
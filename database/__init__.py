@@ -1,4 +1,6 @@
 # database/__init__.py
+from .change_watcher import ChangeWatcher
 from .db_manager import DatabaseManager
+from .log_writer import FilterLogWriter
 
-__all__ = ['DatabaseManager']
\ No newline at end of file
+__all__ = ['ChangeWatcher', 'DatabaseManager', 'FilterLogWriter']
\ No newline at end of file
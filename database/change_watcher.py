@@ -0,0 +1,114 @@
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class ChangeWatcher:
+    """
+    Báo thay đổi giữa các process dùng chung file SQLite, gần như không tốn query
+
+    - PRAGMA data_version trên một connection riêng: chỉ đổi khi connection khác commit,
+      kiểm tra bằng shared memory của WAL, không đọc bảng
+    - Chỉ khi data_version đổi mới đọc bảng change_versions (vài dòng) để biết nguồn nào đổi
+    - watch_file: theo dõi mtime/inode của file (vd. con trỏ CURRENT của model artifact)
+    """
+
+    POLL_INTERVAL = 0.5  # Giây; thay đổi được áp dụng trong khoảng một chu kỳ
+
+    def __init__(self, db_manager, poll_interval: float = None):
+        self.db = db_manager
+        self.poll_interval = poll_interval or self.POLL_INTERVAL
+        self._subscribers: Dict[str, List[Callable[[], object]]] = {}
+        self._file_watches: List[list] = []  # [path, callback, last_signature]
+        self._versions: Dict[str, int] = {}
+        self._data_version = None
+        self._conn = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def subscribe(self, name: str, callback: Callable[[], object]):
+        """Gọi callback() khi change_versions[name] đổi"""
+        self._subscribers.setdefault(name, []).append(callback)
+
+    def watch_file(self, path: str, callback: Callable[[], object]):
+        """Gọi callback() khi file bị ghi/thay thế"""
+        self._file_watches.append([path, callback, self._file_signature(path)])
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._conn = self.db._create_connection()
+        self._data_version = self._read_data_version()
+        self._versions = self._read_versions()
+        # Snapshot của subscriber được nạp trước baseline này → thay đổi commit xen giữa sẽ không bao giờ được báo.
+        # Gọi mỗi callback một lần sau khi lấy baseline (callback tự so version, không đổi thì không nạp lại)
+        for name, callbacks in self._subscribers.items():
+            self._notify(name, callbacks)
+        for path, callback, _ in self._file_watches:
+            self._notify(path, [callback])
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='change-watcher')
+        self._thread.daemon = True
+        self._thread.start()
+        print(f"Change watcher started (every {self.poll_interval}s)")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.check_once()
+            except Exception as e:
+                print(f"❌ Error in change watcher: {e}")
+
+    def check_once(self) -> List[str]:
+        """Kiểm tra một lượt, gọi callback của các nguồn đã đổi. Returns: tên các nguồn đã đổi"""
+        changed = []
+
+        data_version = self._read_data_version()
+        if data_version != self._data_version:
+            self._data_version = data_version
+            versions = self._read_versions()
+            for name, version in versions.items():
+                if self._versions.get(name) != version:
+                    changed.append(name)
+                    self._notify(name, self._subscribers.get(name, []))
+            self._versions = versions
+
+        for watch in self._file_watches:
+            signature = self._file_signature(watch[0])
+            if signature != watch[2]:
+                watch[2] = signature
+                changed.append(watch[0])
+                self._notify(watch[0], [watch[1]])
+
+        return changed
+
+    def _notify(self, name: str, callbacks: List[Callable[[], object]]):
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"❌ Error handling change of {name}: {e}")
+
+    def _read_data_version(self) -> int:
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _read_versions(self) -> Dict[str, int]:
+        return dict(self._conn.execute("SELECT name, version FROM change_versions").fetchall())
+
+    @staticmethod
+    def _file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_ino, stat.st_size)
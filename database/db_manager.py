@@ -1,20 +1,295 @@
 import sqlite3
 import json
+import queue
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
 
 class DatabaseManager:
-    def __init__(self, db_path: str):
+    POOL_SIZE = 8  # Số connection rảnh tối đa giữ lại trong pool
+    BUSY_TIMEOUT = 30  # Giây chờ khi DB đang bị khóa ghi
+    
+    def __init__(self, db_path: str, pool_size: int = None):
         self.db_path = db_path
+        # Pool connection dùng chung giữa các thread (Flask tạo thread mới cho mỗi request)
+        self._pool = queue.Queue(maxsize=pool_size or self.POOL_SIZE)
         self.init_database()
     
+    def _create_connection(self) -> sqlite3.Connection:
+        """Mở connection mới với WAL và các pragma tối ưu"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.BUSY_TIMEOUT,
+            check_same_thread=False  # Connection được trả về pool và tái sử dụng ở thread khác
+        )
+        # WAL: reader không chặn writer, commit chỉ append vào file -wal
+        conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL an toàn với WAL (chỉ fsync khi checkpoint) → bỏ fsync mỗi commit
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA cache_size=-16000")  # ~16MB page cache mỗi connection
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+    
+    @contextmanager
+    def _connection(self):
+        """Mượn một connection từ pool, trả lại khi xong"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._create_connection()
+        
+        try:
+            yield conn
+        finally:
+            # Không để transaction dở dang rò sang lần mượn sau
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+    
+    def close(self):
+        """Đóng toàn bộ connection đang rảnh trong pool"""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+    
     # Dán đoạn code này vào file database/db_manager.py, thay thế cho hàm init_database() cũ
 
     def init_database(self):
-        """Khởi tạo database và các bảng"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Khởi tạo database, các bảng và chạy migration còn thiếu"""
+        with self._connection() as conn, conn:
+            self._create_schema(conn.cursor())
+        
+        self.run_migrations()
+    
+    def _migrations(self) -> List[tuple]:
+        """
+        Danh sách migration theo thứ tự version
+        Mỗi phần tử: (version, mô tả, hàm nhận cursor). Chỉ thêm vào cuối, không sửa migration cũ.
+        """
+        return [
+            (1, 'Thêm cột lease (worker_id, lease_expires_at) cho messages', self._migration_lease_columns),
+            (2, 'Thêm index cho status/created_at, created_at và filter_logs.message_id', self._migration_query_indexes),
+            (3, 'Thêm bảng message_counters và trigger cập nhật thống kê', self._migration_message_counters),
+            (4, 'Thêm bảng llm_verdict_cache', self._migration_verdict_cache),
+            (5, 'Thêm bảng keyword_rules cho mock/fallback analysis', self._migration_keyword_rules),
+            (6, 'Thêm cột review (reviewed_label, reviewed_at, trained_at) cho messages', self._migration_review_columns),
+            (7, 'Thêm bảng change_versions và trigger tăng version khi settings đổi', self._migration_change_versions),
+            (8, 'Thêm version cho keyword_rules vào change_versions', self._migration_keyword_rules_version),
+            (9, 'Nạp keyword rule mặc định (chỉ một lần)', self._migration_seed_keyword_rules),
+            (10, 'Thêm cột decided_by cho messages', self._migration_decided_by_column),
+        ]
+    
+    def get_schema_version(self) -> int:
+        """Version schema hiện tại (lưu trong PRAGMA user_version)"""
+        with self._connection() as conn:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+    
+    def run_migrations(self):
+        """Chạy lần lượt các migration có version lớn hơn version hiện tại"""
+        for version, description, migrate in self._migrations():
+            with self._connection() as conn, conn:
+                cursor = conn.cursor()
+                # Khóa ghi trước khi đọc version → nhiều process khởi động cùng lúc không chạy trùng
+                cursor.execute("BEGIN IMMEDIATE")
+                current_version = cursor.execute("PRAGMA user_version").fetchone()[0]
+                if current_version >= version:
+                    continue
+                
+                migrate(cursor)
+                cursor.execute(f"PRAGMA user_version = {int(version)}")
+                print(f"🗄️ Applied migration {version}: {description}")
+    
+    def _migration_lease_columns(self, cursor: sqlite3.Cursor):
+        cursor.execute("PRAGMA table_info(messages)")
+        message_columns = {row[1] for row in cursor.fetchall()}
         
+        # DB tạo bởi bản cũ có thể đã có cột nhưng chưa có version
+        if 'worker_id' not in message_columns:
+            cursor.execute("ALTER TABLE messages ADD COLUMN worker_id TEXT")
+        if 'lease_expires_at' not in message_columns:
+            cursor.execute("ALTER TABLE messages ADD COLUMN lease_expires_at REAL")
+    
+    def _migration_query_indexes(self, cursor: sqlite3.Cursor):
+        # Inbox, pending, lease, stats: lọc theo status rồi sắp theo created_at (rowid id có sẵn trong index)
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_messages_status_created_at ON messages (status, created_at)"
+        )
+        # Admin: liệt kê toàn bộ theo created_at
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_messages_created_at ON messages (created_at)"
+        )
+        # JOIN filter_logs theo message_id
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_filter_logs_message_id ON filter_logs (message_id)"
+        )
+        cursor.execute("ANALYZE")
+    
+    def _migration_message_counters(self, cursor: sqlite3.Cursor):
+        # dimension 'status': đếm theo status; 'classification': chỉ đếm message đã xử lý xong
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS message_counters (
+                dimension TEXT NOT NULL,
+                value TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (dimension, value)
+            ) WITHOUT ROWID
+        ''')
+        
+        # Trigger chạy trong cùng transaction với INSERT/UPDATE/DELETE trên messages
+        # → add_message, update_message_status, claim, bulk insert... đều cập nhật counter nguyên tử
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_message_counters_insert
+            AFTER INSERT ON messages
+            BEGIN
+                {self._counter_delta_sql('NEW', +1)}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_message_counters_update
+            AFTER UPDATE OF status, classification ON messages
+            WHEN OLD.status IS NOT NEW.status OR OLD.classification IS NOT NEW.classification
+            BEGIN
+                {self._counter_delta_sql('OLD', -1)}
+                {self._counter_delta_sql('NEW', +1)}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_message_counters_delete
+            AFTER DELETE ON messages
+            BEGIN
+                {self._counter_delta_sql('OLD', -1)}
+            END
+        ''')
+        
+        self._rebuild_message_counters(cursor)
+    
+    def _migration_verdict_cache(self, cursor: sqlite3.Cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS llm_verdict_cache (
+                key TEXT PRIMARY KEY,
+                verdict TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        ''')
+    
+    def _migration_keyword_rules(self, cursor: sqlite3.Cursor):
+        # updated_at dạng epoch (REAL) để biết rule sửa lúc nào
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS keyword_rules (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                rule_set TEXT NOT NULL,
+                keyword TEXT NOT NULL,
+                weight REAL NOT NULL,
+                enabled BOOLEAN NOT NULL DEFAULT 1,
+                updated_at REAL NOT NULL,
+                UNIQUE (rule_set, keyword)
+            )
+        ''')
+    
+    def _migration_review_columns(self, cursor: sqlite3.Cursor):
+        cursor.execute("PRAGMA table_info(messages)")
+        message_columns = {row[1] for row in cursor.fetchall()}
+        
+        # reviewed_label: nhãn admin gán; trained_at: thời điểm review đã được học vào model (NULL = chưa)
+        for column, column_type in (('reviewed_label', 'TEXT'), ('reviewed_at', 'REAL'), ('trained_at', 'REAL')):
+            if column not in message_columns:
+                cursor.execute(f"ALTER TABLE messages ADD COLUMN {column} {column_type}")
+        
+        # Index nhỏ chỉ chứa review chưa học → trainer không quét cả bảng
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_messages_untrained_reviews ON messages (reviewed_at)
+            WHERE reviewed_label IS NOT NULL AND trained_at IS NULL
+        ''')
+    
+    def _migration_change_versions(self, cursor: sqlite3.Cursor):
+        # Mỗi nguồn cấu hình một counter; reader chỉ cần so sánh version thay vì đọc lại cả bảng
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS change_versions (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO change_versions (name, version) VALUES ('settings', 0)")
+        
+        self._create_change_version_triggers(cursor, 'settings', 'system_settings')
+    
+    def _migration_keyword_rules_version(self, cursor: sqlite3.Cursor):
+        cursor.execute("INSERT OR IGNORE INTO change_versions (name, version) VALUES ('keyword_rules', 0)")
+        self._create_change_version_triggers(cursor, 'keyword_rules', 'keyword_rules')
+    
+    def _migration_seed_keyword_rules(self, cursor: sqlite3.Cursor):
+        # Chạy đúng một lần cho mỗi DB → admin xóa hết rule thì lần khởi động sau không bị nạp lại
+        if cursor.execute("SELECT 1 FROM keyword_rules LIMIT 1").fetchone():
+            return
+        
+        now = time.time()
+        cursor.executemany(
+            "INSERT INTO keyword_rules (rule_set, keyword, weight, updated_at) VALUES (?, ?, ?, ?)",
+            [
+                (rule_set, keyword, weight, now)
+                for rule_set, keywords in self.DEFAULT_KEYWORD_RULES.items()
+                for keyword, weight in keywords.items()
+            ]
+        )
+    
+    def _migration_decided_by_column(self, cursor: sqlite3.Cursor):
+        cursor.execute("PRAGMA table_info(messages)")
+        message_columns = {row[1] for row in cursor.fetchall()}
+        
+        # Bước nào ra quyết định cuối: naive_bayes, llm, keyword_fallback, naive_bayes_fallback, error_fallback
+        if 'decided_by' not in message_columns:
+            cursor.execute("ALTER TABLE messages ADD COLUMN decided_by TEXT")
+    
+    @staticmethod
+    def _create_change_version_triggers(cursor: sqlite3.Cursor, name: str, table: str):
+        # Trigger chạy trong transaction ghi bảng → mọi đường ghi (API, script, process khác) đều tăng version
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{name}_version_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE change_versions SET version = version + 1 WHERE name = '{name}';
+                END
+            ''')
+    
+    @staticmethod
+    def _counter_delta_sql(row: str, delta: int) -> str:
+        """SQL cộng delta vào counter status/classification của row (NEW hoặc OLD) trong trigger"""
+        return f'''
+                INSERT INTO message_counters (dimension, value, count)
+                VALUES ('status', COALESCE({row}.status, ''), {delta})
+                ON CONFLICT (dimension, value) DO UPDATE SET count = count + ({delta});
+                INSERT INTO message_counters (dimension, value, count)
+                SELECT 'classification', COALESCE({row}.classification, ''), {delta}
+                WHERE {row}.status NOT IN ('pending', 'processing')
+                ON CONFLICT (dimension, value) DO UPDATE SET count = count + ({delta});
+        '''
+    
+    def _rebuild_message_counters(self, cursor: sqlite3.Cursor):
+        """Tính lại toàn bộ counter từ bảng messages"""
+        cursor.execute("DELETE FROM message_counters")
+        cursor.execute('''
+            INSERT INTO message_counters (dimension, value, count)
+            SELECT 'status', COALESCE(status, ''), COUNT(*)
+            FROM messages
+            GROUP BY status
+        ''')
+        cursor.execute('''
+            INSERT INTO message_counters (dimension, value, count)
+            SELECT 'classification', COALESCE(classification, ''), COUNT(*)
+            FROM messages
+            WHERE status NOT IN ('pending', 'processing')
+            GROUP BY classification
+        ''')
+    
+    def _create_schema(self, cursor: sqlite3.Cursor):
+        """Tạo bảng và dữ liệu mặc định"""
         # 1. Tạo bảng system_settings
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS system_settings (
@@ -65,7 +340,18 @@ class DatabaseManager:
             ('suspicious_threshold', '0.5', 'float', 'Ngưỡng đánh dấu suspicious', 'filter'),
             ('enable_mock_fallback', 'true', 'boolean', 'Bật mock analysis khi LLM lỗi', 'system'),
             ('max_processing_time', '30', 'int', 'Timeout tối đa (giây)', 'system'),
-            ('enable_health_check', 'true', 'boolean', 'Bật kiểm tra health LLM', 'system')
+            ('bulk_ingest_batch_size', '500', 'int', 'Số message mỗi lượt executemany của /api/send_messages', 'system'),
+            ('bulk_ingest_max_messages', '10000', 'int', 'Số message tối đa trong một request /api/send_messages', 'system'),
+            ('llm_max_concurrency', '4', 'int', 'Số request LLM chạy đồng thời tối đa (áp dụng khi khởi động lại processor)', 'llm'),
+            ('llm_batch_size', '5', 'int', 'Số message tối đa gộp trong một prompt LLM', 'llm'),
+            ('llm_hedge_after_ms', '0', 'int', 'Gửi thêm request sang provider thứ hai nếu quá số ms này (0 = tắt)', 'llm'),
+            ('llm_connect_timeout', '5', 'float', 'Timeout kết nối tới LLM provider (giây, áp dụng khi khởi động lại)', 'llm'),
+            ('llm_max_retries', '2', 'int', 'Số lần retry có backoff khi provider trả 429/5xx (áp dụng khi khởi động lại)', 'llm'),
+            ('enable_health_check', 'true', 'boolean', 'Bật kiểm tra health LLM', 'system'),
+            ('llm_health_check_interval', '60', 'int', 'Chu kỳ (giây) probe health LLM chạy nền', 'system'),
+            ('online_training_enabled', 'true', 'boolean', 'Tự cập nhật model Naive Bayes từ message admin đã review', 'model'),
+            ('online_training_interval', '300', 'int', 'Chu kỳ (giây) cập nhật model từ review (áp dụng khi khởi động lại)', 'model'),
+            ('online_training_min_batch', '5', 'int', 'Số review chưa học tối thiểu cho một lần cập nhật model', 'model')
         ]
         
         for key, value, data_type, desc, category in default_settings:
@@ -75,26 +361,24 @@ class DatabaseManager:
                 VALUES (?, ?, ?, ?, ?)
             ''', (key, value, data_type, desc, category))
         
-        # FIX: Chỉ commit và close kết nối một lần duy nhất ở cuối hàm
-        conn.commit()
-        conn.close()
     
     # Thêm methods cho settings
     def get_setting(self, key: str, default=None):
         """Lấy giá trị setting"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT value, data_type FROM system_settings WHERE key = ?", (key,))
-        result = cursor.fetchone()
-        conn.close()
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT value, data_type FROM system_settings WHERE key = ?", (key,))
+            result = cursor.fetchone()
         
         if not result:
             return default
             
         value, data_type = result
-        
-        # Convert theo data type
+        return self._convert_setting(value, data_type)
+    
+    @staticmethod
+    def _convert_setting(value: str, data_type: str):
+        """Convert giá trị setting (lưu dạng text) theo data type"""
         if data_type == 'int':
             return int(value)
         elif data_type == 'float':
@@ -103,12 +387,33 @@ class DatabaseManager:
             return value.lower() in ('true', '1', 'yes')
         else:
             return value
+    
+    def get_change_version(self, name: str) -> int:
+        """Version hiện tại của một nguồn cấu hình (tăng mỗi lần dữ liệu đổi)"""
+        with self._connection() as conn:
+            row = conn.execute("SELECT version FROM change_versions WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+    
+    def load_settings_snapshot(self) -> tuple:
+        """
+        Đọc toàn bộ settings (đã convert kiểu) cùng version trong một read transaction
+        Returns: (version, {key: value}); version và giá trị luôn khớp nhau
+        """
+        with self._connection() as conn:
+            conn.execute("BEGIN")
+            version = conn.execute(
+                "SELECT version FROM change_versions WHERE name = 'settings'"
+            ).fetchone()
+            rows = conn.execute("SELECT key, value, data_type FROM system_settings").fetchall()
+        
+        settings = {key: self._convert_setting(value, data_type) for key, value, data_type in rows}
+        return (version[0] if version else 0), settings
 
     def update_setting(self, key: str, value: any):
         """Cập nhật setting một cách an toàn"""
         try:
-            # 'with' sẽ tự động quản lý việc commit hoặc rollback
-            with sqlite3.connect(self.db_path) as conn:
+            # 'with conn' sẽ tự động quản lý việc commit hoặc rollback
+            with self._connection() as conn, conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     UPDATE system_settings 
@@ -122,13 +427,11 @@ class DatabaseManager:
 
     def get_all_settings(self) -> Dict:
         """Lấy tất cả settings theo category"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM system_settings ORDER BY category, key")
-        rows = cursor.fetchall()
-        conn.close()
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute("SELECT * FROM system_settings ORDER BY category, key")
+            rows = cursor.fetchall()
         
         settings = {}
         for row in rows:
@@ -146,46 +449,206 @@ class DatabaseManager:
         
         return settings
         
-    def add_message(self, content: str, sender: str) -> int:
-        """Thêm message vào queue"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def add_message(self, content: str, sender: str, status: str = 'pending',
+                    classification: str = None, naive_bayes_score: float = None,
+                    decided_by: str = None) -> int:
+        """
+        Thêm message vào queue
+        status khác 'pending': message đã có quyết định (vd. /api/classify) → ghi luôn kết quả trong cùng INSERT
+        """
+        with self._connection() as conn, conn:
+            cursor = conn.cursor()
+            if status == 'pending':
+                cursor.execute(
+                    "INSERT INTO messages (content, sender) VALUES (?, ?)",
+                    (content, sender)
+                )
+            else:
+                cursor.execute(
+                    """INSERT INTO messages (content, sender, status, classification, naive_bayes_score,
+                                             decided_by, processed_at)
+                       VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)""",
+                    (content, sender, status, classification, naive_bayes_score, decided_by)
+                )
+            message_id = cursor.lastrowid
         
-        cursor.execute(
-            "INSERT INTO messages (content, sender) VALUES (?, ?)",
-            (content, sender)
-        )
+        return message_id
+    
+    def add_messages(self, messages: List[tuple], batch_size: int = None) -> List[int]:
+        """
+        Thêm nhiều message trong một transaction bằng executemany
+        messages: [(content, sender), ...]
+        batch_size: số message mỗi lượt executemany (mặc định: tất cả); lỗi ở bất kỳ lượt nào rollback cả request
+        Returns: id đã cấp, cùng thứ tự với messages
+        """
+        if not messages:
+            return []
         
-        message_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with self._connection() as conn, conn:
+            cursor = conn.cursor()
+            # Giữ write lock suốt lượt insert → id AUTOINCREMENT liên tiếp, suy ra được từ last_insert_rowid
+            cursor.execute("BEGIN IMMEDIATE")
+            batch_size = batch_size or len(messages)
+            for start in range(0, len(messages), batch_size):
+                cursor.executemany(
+                    "INSERT INTO messages (content, sender) VALUES (?, ?)",
+                    messages[start:start + batch_size]
+                )
+            last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
         
-        return message_id
+        return list(range(last_id - len(messages) + 1, last_id + 1))
+    
+    def get_message(self, message_id: int) -> Optional[Dict]:
+        """Lấy một message theo id"""
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute("SELECT * FROM messages WHERE id = ?", (message_id,))
+            row = cursor.fetchone()
+        
+        return dict(row) if row else None
     
     def get_pending_messages(self) -> List[Dict]:
         """Lấy các message chưa xử lý"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute(
+                "SELECT * FROM messages WHERE status = 'pending' ORDER BY created_at"
+            )
+            messages = [dict(row) for row in cursor.fetchall()]
         
-        cursor.execute(
-            "SELECT * FROM messages WHERE status = 'pending' ORDER BY created_at"
-        )
+        return messages
+    
+    def claim_messages(self, worker_id: str, limit: int = 100,
+                       lease_seconds: float = 300,
+                       message_ids: Optional[List[int]] = None) -> List[Dict]:
+        """
+        Claim nguyên tử một batch message pending cho worker
+        Chuyển status pending → processing kèm worker_id và thời hạn lease.
+        message_ids: chỉ claim các id này (nếu còn pending), mặc định lấy các message cũ nhất
+        Returns: các message đã claim, giữ thứ tự của message_ids nếu có
+        """
+        if message_ids is not None and not message_ids:
+            return []
+        
+        with self._connection() as conn, conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            # Kiểm tra chỉ đọc trước (không cần lock): worker rảnh poll DB không chiếm write lock
+            # của SQLite, không tranh với insert của front end
+            if message_ids is None and cursor.execute(
+                    "SELECT 1 FROM messages WHERE status = 'pending' LIMIT 1").fetchone() is None:
+                return []
+            
+            # BEGIN IMMEDIATE giữ write lock ngay từ đầu → hai worker không claim trùng
+            cursor.execute("BEGIN IMMEDIATE")
+            
+            if message_ids is not None:
+                message_ids = list(dict.fromkeys(message_ids))[:limit]
+                placeholders = ', '.join('?' for _ in message_ids)
+                cursor.execute(
+                    f"SELECT id FROM messages WHERE status = 'pending' AND id IN ({placeholders})",
+                    message_ids
+                )
+            else:
+                cursor.execute(
+                    "SELECT id FROM messages WHERE status = 'pending' ORDER BY created_at, id LIMIT ?",
+                    (limit,)
+                )
+            
+            claimed_ids = [row['id'] for row in cursor.fetchall()]
+            if not claimed_ids:
+                return []
+            
+            placeholders = ', '.join('?' for _ in claimed_ids)
+            cursor.execute(
+                f"""UPDATE messages
+                    SET status = 'processing', worker_id = ?, lease_expires_at = ?
+                    WHERE id IN ({placeholders})""",
+                [worker_id, time.time() + lease_seconds, *claimed_ids]
+            )
+            cursor.execute(
+                f"SELECT * FROM messages WHERE id IN ({placeholders})",
+                claimed_ids
+            )
+            rows = {row['id']: dict(row) for row in cursor.fetchall()}
         
-        messages = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        order = message_ids if message_ids is not None else claimed_ids
+        return [rows[message_id] for message_id in order if message_id in rows]
+    
+    def renew_leases(self, worker_id: str, message_ids: List[int], lease_seconds: float = 300) -> int:
+        """Gia hạn lease cho các message worker đang xử lý"""
+        if not message_ids:
+            return 0
         
-        return messages
+        with self._connection() as conn, conn:
+            placeholders = ', '.join('?' for _ in message_ids)
+            cursor = conn.execute(
+                f"""UPDATE messages SET lease_expires_at = ?
+                    WHERE status = 'processing' AND worker_id = ? AND id IN ({placeholders})""",
+                [time.time() + lease_seconds, worker_id, *message_ids]
+            )
+            renewed = cursor.rowcount
+        
+        return renewed
+    
+    def release_messages(self, worker_id: str, message_ids: List[int]) -> int:
+        """Trả các message worker đã claim nhưng chưa xử lý về pending"""
+        if not message_ids:
+            return 0
+        
+        with self._connection() as conn, conn:
+            placeholders = ', '.join('?' for _ in message_ids)
+            cursor = conn.execute(
+                f"""UPDATE messages
+                    SET status = 'pending', worker_id = NULL, lease_expires_at = NULL
+                    WHERE status = 'processing' AND worker_id = ? AND id IN ({placeholders})""",
+                [worker_id, *message_ids]
+            )
+            released = cursor.rowcount
+        
+        return released
+    
+    def reclaim_expired_leases(self) -> List[int]:
+        """Trả các message có lease hết hạn (worker chết/treo) về pending"""
+        with self._connection() as conn, conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(
+                "SELECT id FROM messages WHERE status = 'processing' AND lease_expires_at < ?",
+                (time.time(),)
+            )
+            expired_ids = [row[0] for row in cursor.fetchall()]
+            
+            if expired_ids:
+                placeholders = ', '.join('?' for _ in expired_ids)
+                cursor.execute(
+                    f"""UPDATE messages
+                        SET status = 'pending', worker_id = NULL, lease_expires_at = NULL
+                        WHERE id IN ({placeholders})""",
+                    expired_ids
+                )
+        
+        return expired_ids
     
     def update_message_status(self, message_id: int, status: str, 
                             classification: str = None, 
                             naive_bayes_score: float = None,
-                            llm_score: float = None):
-        """Cập nhật trạng thái message"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        update_fields = ["status = ?", "processed_at = CURRENT_TIMESTAMP"]
+                            llm_score: float = None,
+                            decided_by: str = None,
+                            worker_id: str = None) -> bool:
+        """
+        Cập nhật trạng thái message
+        worker_id: chỉ ghi khi worker này còn giữ lease; lease đã hết hạn và bị worker khác claim lại
+        thì bỏ qua, không ghi đè kết quả của owner mới
+        Returns: True nếu đã ghi
+        """
+        # Xử lý xong → giải phóng lease
+        update_fields = [
+            "status = ?", "processed_at = CURRENT_TIMESTAMP",
+            "worker_id = NULL", "lease_expires_at = NULL"
+        ]
         values = [status]
         
         if classification:
@@ -200,64 +663,322 @@ class DatabaseManager:
             update_fields.append("llm_score = ?")
             values.append(llm_score)
         
+        if decided_by:
+            update_fields.append("decided_by = ?")
+            values.append(decided_by)
+        
         values.append(message_id)
         
         query = f"UPDATE messages SET {', '.join(update_fields)} WHERE id = ?"
-        cursor.execute(query, values)
+        if worker_id is not None:
+            query += " AND status = 'processing' AND worker_id = ?"
+            values.append(worker_id)
         
-        conn.commit()
-        conn.close()
+        with self._connection() as conn, conn:
+            updated = conn.execute(query, values).rowcount
+        
+        return updated > 0
     
     def log_filter_step(self, message_id: int, step: str, result: str, details: str = None):
         """Ghi log các bước filter"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self._connection() as conn, conn:
+            conn.execute(
+                "INSERT INTO filter_logs (message_id, step, result, details) VALUES (?, ?, ?, ?)",
+                (message_id, step, result, details or "")
+            )
+    
+    def log_filter_steps(self, records: List[tuple]):
+        """Ghi nhiều log trong một transaction
+        records: [(message_id, step, result, details), ...]
+        """
+        with self._connection() as conn, conn:
+            conn.executemany(
+                "INSERT INTO filter_logs (message_id, step, result, details) VALUES (?, ?, ?, ?)",
+                [
+                    (message_id, step, result, details or "")
+                    for message_id, step, result, details in records
+                ]
+            )
+    
+    def get_inbox_messages(self, status: str = 'approved', limit: int = None,
+                           before: tuple = None) -> List[Dict]:
+        """
+        Lấy messages trong inbox, mới nhất trước
+        Keyset pagination: before=(created_at, id) của dòng cuối trang trước
+        """
+        query = "SELECT * FROM messages WHERE status = ?"
+        params = [status]
         
-        cursor.execute(
-            "INSERT INTO filter_logs (message_id, step, result, details) VALUES (?, ?, ?, ?)",
-            (message_id, step, result, details or "")
-        )
+        if before is not None:
+            query += " AND (created_at, id) < (?, ?)"
+            params.extend(before)
         
-        conn.commit()
-        conn.close()
-    
-    def get_inbox_messages(self, status: str = 'approved') -> List[Dict]:
-        """Lấy messages trong inbox"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        query += " ORDER BY created_at DESC, id DESC"
         
-        cursor.execute(
-            "SELECT * FROM messages WHERE status = ? ORDER BY created_at DESC",
-            (status,)
-        )
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
         
-        messages = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute(query, params)
+            messages = [dict(row) for row in cursor.fetchall()]
         
         return messages
     
-    def get_all_messages_with_logs(self) -> List[Dict]:
-        """Lấy tất cả messages kèm logs để debug"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
+    def get_all_messages_with_logs(self, limit: int = None, before: tuple = None) -> List[Dict]:
+        """
+        Lấy messages kèm logs để debug, mới nhất trước
+        Chỉ gom filter_logs cho các message trong trang (before=(created_at, id) như get_inbox_messages)
+        """
         query = '''
             SELECT m.*, 
-                   GROUP_CONCAT(
-                       fl.step || ': ' || fl.result || 
-                       CASE WHEN fl.details != '' THEN ' (' || fl.details || ')' ELSE '' END
-                       , ' | '
+                   (
+                       SELECT GROUP_CONCAT(
+                           fl.step || ': ' || fl.result || 
+                           CASE WHEN fl.details != '' THEN ' (' || fl.details || ')' ELSE '' END
+                           , ' | '
+                       )
+                       FROM filter_logs fl
+                       WHERE fl.message_id = m.id
                    ) as filter_history
             FROM messages m
-            LEFT JOIN filter_logs fl ON m.id = fl.message_id
-            GROUP BY m.id
-            ORDER BY m.created_at DESC
         '''
+        params = []
+        
+        if before is not None:
+            query += " WHERE (m.created_at, m.id) < (?, ?)"
+            params.extend(before)
+        
+        query += " ORDER BY m.created_at DESC, m.id DESC"
+        
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute(query, params)
+            messages = [dict(row) for row in cursor.fetchall()]
+        
+        return messages
+    
+    def _read_message_counters(self, cursor: sqlite3.Cursor) -> Dict:
+        cursor.execute("SELECT dimension, value, count FROM message_counters WHERE count != 0")
+        counters = {'status': {}, 'classification': {}}
+        for dimension, value, count in cursor.fetchall():
+            counters.setdefault(dimension, {})[value] = count
+        return counters
+    
+    def get_message_stats(self) -> Dict:
+        """Thống kê tổng quan, đọc từ message_counters (O(1) theo số message)"""
+        with self._connection() as conn:
+            counters = self._read_message_counters(conn.cursor())
+        
+        status_counts = counters['status']
+        classification_counts = counters['classification']
+        
+        return {
+            'total_processed': sum(classification_counts.values()),
+            'legitimate': classification_counts.get('legitimate', 0),
+            'suspicious': classification_counts.get('suspicious', 0),
+            'spam': classification_counts.get('spam', 0),
+            'blocked': status_counts.get('blocked', 0),
+            'flagged': status_counts.get('flagged', 0),
+            'approved': status_counts.get('approved', 0)
+        }
+    
+    def reconcile_message_counters(self) -> bool:
+        """
+        Đối soát message_counters với bảng messages và sửa sai lệch
+        Returns: True nếu phát hiện sai lệch
+        """
+        with self._connection() as conn, conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            before = self._read_message_counters(cursor)
+            self._rebuild_message_counters(cursor)
+            after = self._read_message_counters(cursor)
+        
+        if before != after:
+            print(f"⚠️ Message counters drift corrected: {before} → {after}")
+            return True
+        return False
+    
+    def get_cached_verdict(self, key: str, max_age_seconds: float) -> Optional[tuple]:
+        """Lấy verdict LLM đã cache còn hạn: (created_at, verdict_json) hoặc None"""
+        with self._connection() as conn:
+            return conn.execute(
+                "SELECT created_at, verdict FROM llm_verdict_cache WHERE key = ? AND created_at >= ?",
+                (key, time.time() - max_age_seconds)
+            ).fetchone()
+    
+    def put_cached_verdict(self, key: str, verdict_json: str, created_at: float = None):
+        """Lưu/ghi đè verdict LLM vào cache bền vững"""
+        with self._connection() as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_verdict_cache (key, verdict, created_at) VALUES (?, ?, ?)",
+                (key, verdict_json, created_at or time.time())
+            )
+    
+    def purge_expired_verdicts(self, max_age_seconds: float) -> int:
+        """Xóa verdict cache quá hạn"""
+        with self._connection() as conn, conn:
+            cursor = conn.execute(
+                "DELETE FROM llm_verdict_cache WHERE created_at < ?",
+                (time.time() - max_age_seconds,)
+            )
+            return cursor.rowcount
+    
+    KEYWORD_RULE_SETS = ('spam', 'legitimate')
+    
+    # Từ khóa và trọng số mặc định cho mock/fallback analysis
+    # (nạp vào bảng keyword_rules bằng migration 9, sau đó sửa qua /api/rules)
+    DEFAULT_KEYWORD_RULES = {
+        'spam': {
+            'trúng giải': 0.9,
+            'vay tiền': 0.8,
+            'khuyến mãi': 0.7,
+            'miễn phí': 0.6,
+            'click link': 0.9,
+            'chuyển khoản': 0.8,
+            'mã otp': 0.9,
+            'xác thực': 0.7,
+            'làm giàu': 0.8,
+            'đầu tư': 0.6,
+            'lợi nhuận': 0.7,
+            'cảnh báo': 0.8,
+            'tài khoản bị khóa': 0.9,
+            'nhấp vào đây': 0.8
+        },
+        'legitimate': {
+            'xin chào': 0.3,
+            'cảm ơn': 0.2,
+            'meeting': 0.2,
+            'dự án': 0.2,
+            'báo cáo': 0.2,
+            'công ty': 0.3,
+            'hỗ trợ': 0.3,
+            'thông tin': 0.4
+        }
+    }
+    
+    @staticmethod
+    def parse_rule_enabled(value) -> bool:
+        """enabled của rule: chỉ nhận bool hoặc 0/1 (chuỗi "false"/"0" không được coi là True)"""
+        if isinstance(value, bool):
+            return value
+        if type(value) is int and value in (0, 1):
+            return bool(value)
+        raise ValueError('enabled must be a boolean or 0/1')
+    
+    def get_keyword_rules(self, enabled_only: bool = False) -> Dict[str, List[Dict]]:
+        """Lấy rule theo rule_set, mỗi rule_set sắp theo id (thứ tự khai báo)"""
+        where_clause = "WHERE enabled = 1" if enabled_only else ""
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute(f'''
+                SELECT id, rule_set, keyword, weight, enabled, updated_at
+                FROM keyword_rules
+                {where_clause}
+                ORDER BY rule_set, id
+            ''')
+            rows = cursor.fetchall()
         
-        cursor.execute(query)
-        messages = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        rules = {rule_set: [] for rule_set in self.KEYWORD_RULE_SETS}
+        for row in rows:
+            rules.setdefault(row['rule_set'], []).append({
+                'id': row['id'],
+                'keyword': row['keyword'],
+                'weight': row['weight'],
+                'enabled': bool(row['enabled']),
+                'updated_at': row['updated_at']
+            })
+        return rules
+    
+    def upsert_keyword_rules(self, rules: List[Dict]) -> int:
+        """
+        Thêm/cập nhật nhiều rule trong một transaction
+        Mỗi rule: {'rule_set', 'keyword', 'weight', 'enabled' (tùy chọn, bool hoặc 0/1, mặc định True)}
+        Raises: ValueError nếu enabled không hợp lệ
+        """
+        now = time.time()
+        values = [
+            (rule['rule_set'], rule['keyword'].strip().lower(), float(rule['weight']),
+             self.parse_rule_enabled(rule.get('enabled', True)), now)
+            for rule in rules
+        ]
         
-        return messages
\ No newline at end of file
+        with self._connection() as conn, conn:
+            cursor = conn.executemany('''
+                INSERT INTO keyword_rules (rule_set, keyword, weight, enabled, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (rule_set, keyword) DO UPDATE SET
+                    weight = excluded.weight,
+                    enabled = excluded.enabled,
+                    updated_at = excluded.updated_at
+            ''', values)
+            return cursor.rowcount
+    
+    def delete_keyword_rule(self, rule_id: int) -> bool:
+        """Xóa một rule theo id"""
+        with self._connection() as conn, conn:
+            cursor = conn.execute("DELETE FROM keyword_rules WHERE id = ?", (rule_id,))
+            return cursor.rowcount > 0
+    
+    # Nhãn review → status hiển thị tương ứng
+    REVIEW_STATUS = {'legitimate': 'approved', 'suspicious': 'flagged', 'spam': 'blocked'}
+    
+    def review_message(self, message_id: int, label: str) -> bool:
+        """
+        Admin gán nhãn cho message đã xử lý: cập nhật status/classification và đưa vào hàng chờ học
+        Review lại message đã học sẽ được học lại với nhãn mới
+        """
+        with self._connection() as conn, conn:
+            cursor = conn.execute('''
+                UPDATE messages
+                SET reviewed_label = ?, reviewed_at = ?, trained_at = NULL,
+                    status = ?, classification = ?
+                WHERE id = ? AND status NOT IN ('pending', 'processing')
+            ''', (label, time.time(), self.REVIEW_STATUS[label], label, message_id))
+            return cursor.rowcount > 0
+    
+    def train_on_reviews(self, train: Callable[[List[Dict]], bool], limit: int = 500, min_batch: int = 1) -> int:
+        """
+        Lấy review chưa học (cũ nhất trước), gọi train(rows) rồi đánh dấu đã học, tất cả trong một transaction
+        BEGIN IMMEDIATE giữ write lock trong lúc train → nhiều process không học trùng một review
+        và không ghi đè model version của nhau. train trả False → không đánh dấu gì.
+        Returns: số review đã học
+        """
+        with self._connection() as conn, conn:
+            cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute('''
+                SELECT id, content, reviewed_label
+                FROM messages
+                WHERE reviewed_label IS NOT NULL AND trained_at IS NULL
+                ORDER BY reviewed_at
+                LIMIT ?
+            ''', (limit,))
+            rows = [dict(row) for row in cursor.fetchall()]
+            if len(rows) < max(1, min_batch) or not train(rows):
+                return 0
+            
+            placeholders = ', '.join('?' for _ in rows)
+            cursor.execute(
+                f"UPDATE messages SET trained_at = ? WHERE id IN ({placeholders})",
+                [time.time(), *(row['id'] for row in rows)]
+            )
+            return len(rows)
+    
+    def count_untrained_reviews(self) -> int:
+        """Số review chưa được học vào model (đếm trên partial index)"""
+        with self._connection() as conn:
+            return conn.execute('''
+                SELECT COUNT(*) FROM messages
+                WHERE reviewed_label IS NOT NULL AND trained_at IS NULL
+            ''').fetchone()[0]
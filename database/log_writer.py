@@ -0,0 +1,98 @@
+import queue
+import threading
+import time
+from typing import List, Tuple
+
+
+class FilterLogWriter:
+    """
+    Gom các bản ghi filter_logs và ghi theo batch trong một transaction
+    Flush khi đủ batch_size bản ghi hoặc sau flush_interval_ms kể từ bản ghi đầu tiên trong buffer.
+    """
+    
+    def __init__(self, db_manager, batch_size: int = 200, flush_interval_ms: int = 250):
+        self.db = db_manager
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.queue = queue.Queue()
+        self.running = False
+        self.thread = None
+    
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self._run, name='filter-log-writer')
+            self.thread.daemon = True
+            self.thread.start()
+            print("Filter log writer started")
+    
+    def stop(self):
+        """Dừng writer và ghi nốt toàn bộ log còn trong buffer"""
+        if not self.running:
+            return
+        
+        self.running = False
+        self.queue.put(None)
+        if self.thread:
+            self.thread.join()
+        
+        # Log được đưa vào sau sentinel
+        self._write(self._drain_nowait())
+        print("Filter log writer stopped")
+    
+    def log(self, message_id: int, step: str, result: str, details: str = None):
+        """Đưa một bước filter vào buffer (ghi trực tiếp nếu writer chưa chạy)"""
+        record = (message_id, step, result, details or "")
+        
+        if not self.running:
+            self._write([record])
+            return
+        
+        self.queue.put(record)
+    
+    def _drain_nowait(self) -> List[Tuple]:
+        records = []
+        while True:
+            try:
+                record = self.queue.get_nowait()
+            except queue.Empty:
+                return records
+            if record is not None:
+                records.append(record)
+    
+    def _run(self):
+        buffer = []
+        deadline = None
+        
+        while True:
+            timeout = None if not buffer else max(0.0, deadline - time.monotonic())
+            
+            try:
+                record = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                # Hết thời gian chờ → flush theo chu kỳ
+                self._write(buffer)
+                buffer = []
+                continue
+            
+            if record is None:
+                buffer.extend(self._drain_nowait())
+                self._write(buffer)
+                return
+            
+            if not buffer:
+                deadline = time.monotonic() + self.flush_interval
+            buffer.append(record)
+            
+            if len(buffer) >= self.batch_size:
+                self._write(buffer)
+                buffer = []
+    
+    def _write(self, records: List[Tuple]):
+        if not records:
+            return
+        
+        try:
+            self.db.log_filter_steps(records)
+        except Exception as e:
+            print(f"❌ Error writing {len(records)} filter logs: {e}")
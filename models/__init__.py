@@ -1,5 +1,8 @@
 # models/__init__.py
 from .naive_bayes import NaiveBayesFilter
 from .llm_analyzer import LLMAnalyzer
+from .llm_router import LLMRouter
+from .verdict_cache import VerdictCache
+from .http_pool import ProviderSessionPool
 
-__all__ = ['NaiveBayesFilter', 'LLMAnalyzer']
\ No newline at end of file
+__all__ = ['NaiveBayesFilter', 'LLMAnalyzer', 'LLMRouter', 'VerdictCache', 'ProviderSessionPool']
\ No newline at end of file
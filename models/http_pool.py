@@ -0,0 +1,97 @@
+import threading
+from typing import Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class _ProviderRetry(Retry):
+    """
+    Retry theo status của từng method: POST (completion) chỉ gửi lại khi provider báo chắc chắn chưa xử lý
+    (429 rate limit, 503 quá tải); 500/502/504 có thể đã chạy xong completion → gửi lại là tính tiền hai lần
+    """
+    
+    POST_RETRY_STATUSES = frozenset({429, 503})
+    
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if method and method.upper() == 'POST' and status_code not in self.POST_RETRY_STATUSES:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+class ProviderSessionPool:
+    """
+    Mỗi LLM provider dùng một requests.Session riêng với connection pool keep-alive
+    → bỏ được TCP/TLS handshake ở mỗi lần gọi. Retry có backoff cho 429/5xx (POST chỉ 429/503).
+    """
+    
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    # Giây chờ tối đa theo Retry-After: mặc định urllib3 cho chờ tới 6 giờ, nằm ngoài timeout của request
+    # → thread LLM stage kẹt cả batch. Provider bắt chờ lâu hơn thì trả 429 để circuit breaker/fallback xử lý
+    RETRY_AFTER_MAX = 5
+    
+    def __init__(self, pool_maxsize: int = 10, connect_timeout: float = 5,
+                 read_timeout: float = 30, max_retries: int = 2, backoff_factor: float = 0.5):
+        self.pool_maxsize = pool_maxsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+    
+    @property
+    def timeout(self) -> tuple:
+        """Timeout mặc định (connect, read)"""
+        return (self.connect_timeout, self.read_timeout)
+    
+    def get_session(self, provider: str) -> requests.Session:
+        """Session keep-alive của provider (tạo khi dùng lần đầu)"""
+        session = self._sessions.get(provider)
+        if session is not None:
+            return session
+        
+        with self._lock:
+            if provider not in self._sessions:
+                self._sessions[provider] = self._create_session()
+            return self._sessions[provider]
+    
+    def _create_session(self) -> requests.Session:
+        retry = _ProviderRetry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=0,  # Không gửi lại request đã tới provider nhưng đọc response bị timeout
+            status=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=frozenset({'GET', 'POST'}),
+            respect_retry_after_header=True,
+            retry_after_max=int(min(self.RETRY_AFTER_MAX, self.read_timeout)),
+            raise_on_status=False  # Hết lượt retry → trả response cuối để raise_for_status xử lý như cũ
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=retry
+        )
+        
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+    
+    def post(self, provider: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        return self.get_session(provider).post(url, **kwargs)
+    
+    def get(self, provider: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        return self.get_session(provider).get(url, **kwargs)
+    
+    def close(self):
+        """Đóng toàn bộ session và connection đang giữ"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
@@ -0,0 +1,136 @@
+from collections import deque
+from typing import Callable, Dict, List, Tuple
+
+from .preprocessing import preprocess_text
+
+
+def _build_patterns(keywords: Dict[str, Dict[str, float]],
+                    normalize: Callable[[str], str]) -> List[Tuple[str, str, float]]:
+    """patterns[i] = (nhóm, từ khóa đã normalize, trọng số); thứ tự giữ theo dict đầu vào"""
+    patterns = []
+    for group, group_keywords in keywords.items():
+        for keyword, weight in group_keywords.items():
+            keyword = normalize(keyword)
+            if keyword:
+                patterns.append((group, keyword, weight))
+    return patterns
+
+
+class _SubstringScan:
+    """Quét `in` từng từ khóa: với danh sách ngắn nhanh hơn automaton (substring search chạy bằng C)"""
+
+    def __init__(self, patterns: List[Tuple[str, str, float]]):
+        self.patterns = patterns
+
+    def find(self, text: str) -> List[int]:
+        return [pattern_id for pattern_id, (_, keyword, _) in enumerate(self.patterns) if keyword in text]
+
+
+class _Automaton:
+    """Automaton Aho–Corasick đã build xong, chỉ đọc (an toàn khi dùng chung giữa các thread)"""
+
+    def __init__(self, patterns: List[Tuple[str, str, float]]):
+        self.patterns = patterns
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[Tuple[int, ...]] = [()]
+
+        for pattern_id, (_, keyword, _) in enumerate(patterns):
+            self._insert(keyword, pattern_id)
+
+        self._build_failure_links()
+
+    def _insert(self, keyword: str, pattern_id: int):
+        state = 0
+        for char in keyword:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(())
+            state = next_state
+        self.output[state] = self.output[state] + (pattern_id,)
+
+    def _build_failure_links(self):
+        # BFS theo độ sâu; output của mỗi state gộp luôn output của state fail → lúc match không phải đi lại chuỗi fail
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find(self, text: str) -> List[int]:
+        """Id các pattern xuất hiện trong text, một lượt duyệt duy nhất"""
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        found = set()
+        state = 0
+
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+
+        return sorted(found)
+
+
+class KeywordMatcher:
+    """
+    Tìm tất cả từ khóa có trọng số trong message
+    Từ AUTOMATON_MIN_KEYWORDS từ khóa trở lên dùng automaton Aho–Corasick build sẵn (chi phí match tỉ lệ
+    với độ dài message, không phụ thuộc số từ khóa); danh sách ngắn hơn quét `in` từng từ khóa.
+    Từ khóa và message cùng đi qua normalize (mặc định preprocess_text) nên khớp cả khi khác NFC/NFD, dấu câu.
+    set_keywords() build index mới rồi thay thế nguyên khối, reader đang match không bị ảnh hưởng.
+    """
+
+    # Điểm giao đo bằng benchmarks/bench_keywords.py: dưới ~100 từ khóa quét substring nhanh hơn automaton
+    AUTOMATON_MIN_KEYWORDS = 100
+
+    def __init__(self, keywords: Dict[str, Dict[str, float]] = None,
+                 normalize: Callable[[str], str] = preprocess_text):
+        self.normalize = normalize
+        self._index = self._build_index(keywords or {})
+
+    def set_keywords(self, keywords: Dict[str, Dict[str, float]]):
+        """Build lại index từ {nhóm: {từ khóa: trọng số}}"""
+        self._index = self._build_index(keywords)
+
+    def _build_index(self, keywords: Dict[str, Dict[str, float]]):
+        patterns = _build_patterns(keywords, self.normalize)
+        if len(patterns) < self.AUTOMATON_MIN_KEYWORDS:
+            return _SubstringScan(patterns)
+        return _Automaton(patterns)
+
+    def match(self, text: str) -> Dict[str, List[Tuple[str, float]]]:
+        """
+        Returns: {nhóm: [(từ khóa, trọng số), ...]} các từ khóa xuất hiện trong text
+        Mỗi từ khóa chỉ tính một lần, theo thứ tự khai báo
+        """
+        return self.match_preprocessed(self.normalize(text))
+
+    def match_preprocessed(self, text: str) -> Dict[str, List[Tuple[str, float]]]:
+        """Như match() nhưng text đã qua normalize (dùng lại kết quả tiền xử lý của pipeline)"""
+        index = self._index
+        matches: Dict[str, List[Tuple[str, float]]] = {}
+        for pattern_id in index.find(text):
+            group, keyword, weight = index.patterns[pattern_id]
+            matches.setdefault(group, []).append((keyword, weight))
+        return matches
+
+    @property
+    def uses_automaton(self) -> bool:
+        return isinstance(self._index, _Automaton)
+
+    @property
+    def keyword_count(self) -> int:
+        return len(self._index.patterns)
@@ -2,120 +2,281 @@ import requests
 import json
 import time
 from datetime import datetime 
-from typing import Dict 
+from typing import Dict, List, Optional
+from .http_pool import ProviderSessionPool
+from .keyword_matcher import KeywordMatcher
 from .llm_health import LLMHealthMonitor, LLMProviderStatus
+from .llm_router import LLMRouter
+from .verdict_cache import VerdictCache
+from .preprocessing import preprocess_text
 
 
 class LLMAnalyzer:
-    def __init__(self, dynamic_config):
+    # Endpoint chat completion và model của từng provider
+    PROVIDER_ENDPOINTS = {
+        'openai': {
+            'url': "https://api.openai.com/v1/chat/completions",
+            'model': "gpt-3.5-turbo",
+            'headers': {}
+        },
+        'groq': {
+            'url': "https://api.groq.com/openai/v1/chat/completions",
+            'model': "openai/gpt-oss-120b",
+            'headers': {}
+        },
+        'openrouter': {
+            'url': "https://openrouter.ai/api/v1/chat/completions",
+            'model': "meta-llama/llama-3.3-70b-instruct:free",
+            'headers': {
+                "HTTP-Referer": "http://localhost:5000",
+                "X-Title": "Spam Filter Demo"
+            }
+        }
+    }
+    
+    MAX_TOKENS_PER_VERDICT = 200
+    
+    def __init__(self, dynamic_config, verdict_cache: VerdictCache = None,
+                 http_pool: ProviderSessionPool = None):
         self.config = dynamic_config
         # FIX 1: Xóa self.provider khỏi __init__. 
         # Chúng ta sẽ lấy provider mới nhất mỗi lần gọi hàm.
-        self.health_monitor = LLMHealthMonitor()
+        # Session keep-alive dùng chung cho cả request phân tích và health check
+        self.http = http_pool or ProviderSessionPool()
+        self.health_monitor = LLMHealthMonitor(self.http)
+        # Chọn provider theo latency/lỗi thực tế, circuit breaker cho provider lỗi liên tục
+        self.router = LLMRouter(self.health_monitor)
+        self.verdict_cache = verdict_cache
+        # Rule của mock/fallback analysis nạp từ bảng keyword_rules qua reload_keyword_rules()
+        self.keyword_matcher = KeywordMatcher()
         self.error_log = []
     
-    def analyze_message(self, message: str) -> dict:
-        """Phân tích message với error tracking chi tiết"""
+    def analyze_message(self, message: str, normalized_text: str = None, check_cache: bool = True) -> dict:
+        """
+        Phân tích message với error tracking chi tiết
+        normalized_text: kết quả preprocess_text(message) nếu pipeline đã tính sẵn
+        check_cache: False khi caller vừa tra cache và miss (tránh tra lại, đếm miss hai lần)
+        """
         start_time = time.time()
+        if normalized_text is None:
+            normalized_text = preprocess_text(message)
         
         # FIX 1: Lấy provider mới nhất trực tiếp từ config
         current_provider = self.config.LLM_PROVIDER.lower()
         
-        health_status = self._check_provider_health()
+        # Nội dung trùng (chiến dịch spam) → dùng lại verdict, không gọi provider
+        cache_key = None
+        if self.verdict_cache is not None:
+            cache_key = VerdictCache.make_key(normalized_text)
+            cached_verdict = self.verdict_cache.get(cache_key) if check_cache else None
+            if cached_verdict is not None:
+                cached_verdict.pop('processing_time_ms', None)
+                return {
+                    'provider': cached_verdict.pop('provider', current_provider),
+                    'health_status': None,
+                    'error_details': None,
+                    **cached_verdict,
+                    'cache_hit': True,
+                    'processing_time_ms': (time.time() - start_time) * 1000
+                }
         
-        # FIX 2: Đảm bảo health_status có thể chuyển đổi thành JSON
-        serializable_health_status = health_status.copy()
-        if 'status' in serializable_health_status and isinstance(serializable_health_status['status'], LLMProviderStatus):
-            serializable_health_status['status'] = serializable_health_status['status'].value
+        health_status = self._check_provider_health()
+        candidates = self._candidate_providers()
 
         result = {
             'provider': current_provider,
-            'health_status': serializable_health_status,
+            'health_status': self._serialize_health_status(health_status),
             'processing_time_ms': 0,
             'error_details': None
         }
         
         try:
-            if health_status['status'] != LLMProviderStatus.HEALTHY:
-                analysis = self._enhanced_mock_analysis(message)
-                fallback_reason = f"Provider {current_provider} is {health_status['status'].value}"
+            if current_provider not in self.PROVIDER_ENDPOINTS:
+                analysis = self._enhanced_mock_analysis(message, normalized_text=normalized_text)
+                result.update(analysis)
+            elif not self.router.rank_providers(candidates):
+                analysis = self._enhanced_mock_analysis(message, normalized_text=normalized_text)
+                fallback_reason = (
+                    f"Provider {current_provider} is {health_status['status'].value}"
+                    f" and no other healthy provider is available"
+                )
                 result.update({ 'fallback_reason': fallback_reason, **analysis })
             else:
-                if current_provider == 'openai':
-                    analysis = self._analyze_with_openai(message)
-                elif current_provider == 'groq':
-                    analysis = self._analyze_with_groq(message)
-                elif current_provider == 'openrouter':
-                    analysis = self._analyze_with_openrouter(message)
-                else:
-                    analysis = self._enhanced_mock_analysis(message)
+                # Router chọn provider nhanh nhất còn khỏe, lỗi thì chuyển provider kế tiếp
+                provider, analysis = self.router.execute(
+                    candidates,
+                    lambda provider: self._analyze_with_provider(provider, message),
+                    hedge_after_ms=self._hedge_after_ms()
+                )
+                if provider != current_provider:
+                    result['provider'] = provider
+                    result['health_status'] = self._serialize_health_status(
+                        self.health_monitor.get_snapshot(provider) or {'status': LLMProviderStatus.UNKNOWN}
+                    )
                 result.update(analysis)
                 
+                # Chỉ cache verdict thật từ provider (không cache mock/fallback/lỗi parse)
+                if (cache_key is not None
+                        and analysis.get('analysis_method') != 'enhanced_mock'
+                        and not analysis.get('parse_error')):
+                    result['processing_time_ms'] = (time.time() - start_time) * 1000
+                    self.verdict_cache.put(cache_key, result)
+                
         except requests.exceptions.RequestException as e:
-            self._log_error(type(e).__name__, str(e))
+            self._log_error(type(e).__name__, str(e), current_provider)
             result.update({
                 'error_details': {'type': type(e).__name__, 'message': str(e), 'provider': current_provider},
-                **self._enhanced_mock_analysis(message, fallback=True)
+                **self._enhanced_mock_analysis(message, fallback=True, normalized_text=normalized_text)
             })
         except Exception as e:
-            self._log_error('unknown', str(e))
+            self._log_error('unknown', str(e), current_provider)
             result.update({
                 'error_details': {'type': 'unknown', 'message': str(e), 'provider': current_provider},
-                **self._enhanced_mock_analysis(message, fallback=True)
+                **self._enhanced_mock_analysis(message, fallback=True, normalized_text=normalized_text)
             })
         
         result['processing_time_ms'] = (time.time() - start_time) * 1000
         return result
     
+    def analyze_messages(self, messages: List[str], normalized_texts: List[str] = None) -> List[dict]:
+        """
+        Phân tích nhiều message trong một chat completion (prompt batch)
+        Message trúng cache không gửi đi; message parse lỗi được phân tích lại ở chế độ từng message.
+        normalized_texts: preprocess_text của từng message nếu pipeline đã tính sẵn
+        Returns: kết quả theo đúng thứ tự đầu vào, cùng format với analyze_message
+        """
+        if normalized_texts is None:
+            normalized_texts = [preprocess_text(message) for message in messages]
+        
+        if len(messages) <= 1:
+            return [
+                self.analyze_message(message, normalized_text)
+                for message, normalized_text in zip(messages, normalized_texts)
+            ]
+        
+        start_time = time.time()
+        current_provider = self.config.LLM_PROVIDER.lower()
+        results = [None] * len(messages)
+        
+        cache_keys = [None] * len(messages)
+        if self.verdict_cache is not None:
+            for index, normalized_text in enumerate(normalized_texts):
+                cache_keys[index] = VerdictCache.make_key(normalized_text)
+        
+        # Message trùng nội dung trong cùng batch chỉ cần hỏi LLM một lần
+        pending = {}  # cache_key hoặc index -> [index, ...]
+        for index, message in enumerate(messages):
+            group_key = cache_keys[index] or index
+            if group_key in pending:
+                pending[group_key].append(index)
+                continue
+            if cache_keys[index] is not None:
+                cached_verdict = self.verdict_cache.get(cache_keys[index])
+                if cached_verdict is not None:
+                    cached_verdict.pop('processing_time_ms', None)
+                    results[index] = {
+                        'provider': cached_verdict.pop('provider', current_provider),
+                        'health_status': None,
+                        'error_details': None,
+                        **cached_verdict,
+                        'cache_hit': True,
+                        'processing_time_ms': (time.time() - start_time) * 1000
+                    }
+                    continue
+            pending[group_key] = [index]
+        
+        groups = list(pending.values())
+        if len(groups) == 1:
+            first = groups[0][0]
+            single_result = self.analyze_message(messages[first], normalized_texts[first], check_cache=False)
+            for index in groups[0]:
+                results[index] = dict(single_result)
+            return results
+        
+        if groups:
+            candidates = self._candidate_providers()
+            if (current_provider not in self.PROVIDER_ENDPOINTS
+                    or not self.router.rank_providers(candidates)):
+                # Không có provider dùng được → để analyze_message xử lý fallback như bình thường
+                for group in groups:
+                    single_result = self.analyze_message(
+                        messages[group[0]], normalized_texts[group[0]], check_cache=False
+                    )
+                    for index in group:
+                        results[index] = dict(single_result)
+                return results
+            
+            batch_messages = [messages[group[0]] for group in groups]
+            prompt = self._create_batch_prompt(batch_messages)
+            try:
+                current_provider, content = self.router.execute(
+                    candidates,
+                    lambda provider: self._chat_completion(
+                        provider, prompt,
+                        max_tokens=self.MAX_TOKENS_PER_VERDICT * len(batch_messages)
+                    ),
+                    hedge_after_ms=self._hedge_after_ms()
+                )
+                verdicts = self._parse_batch_llm_response(content, len(batch_messages))
+            except Exception as e:
+                # Lỗi request cả batch → fallback mock, không gửi lại từng message vào provider đang lỗi
+                error_type = type(e).__name__ if isinstance(e, requests.exceptions.RequestException) else 'unknown'
+                self._log_error(error_type, str(e), current_provider)
+                elapsed_ms = (time.time() - start_time) * 1000
+                for group, message in zip(groups, batch_messages):
+                    fallback = {
+                        'provider': current_provider,
+                        'health_status': None,
+                        'processing_time_ms': elapsed_ms,
+                        'error_details': {'type': error_type, 'message': str(e), 'provider': current_provider},
+                        **self._enhanced_mock_analysis(
+                            message, fallback=True, normalized_text=normalized_texts[group[0]]
+                        )
+                    }
+                    for index in group:
+                        results[index] = dict(fallback)
+                return results
+            
+            elapsed_ms = (time.time() - start_time) * 1000
+            for group, message, verdict in zip(groups, batch_messages, verdicts):
+                if verdict is None:
+                    # Không map được kết quả → hỏi lại riêng message này
+                    result = self.analyze_message(message, normalized_texts[group[0]], check_cache=False)
+                else:
+                    result = {
+                        'provider': current_provider,
+                        'health_status': None,
+                        'error_details': None,
+                        **verdict,
+                        'batch_size': len(batch_messages),
+                        'processing_time_ms': elapsed_ms
+                    }
+                    if cache_keys[group[0]] is not None:
+                        self.verdict_cache.put(cache_keys[group[0]], result)
+                for index in group:
+                    results[index] = dict(result)
+        
+        return results
+    
     # Thêm vào LLM Analyzer
-    def _enhanced_mock_analysis(self, message: str, fallback: bool = False) -> dict:
+    def _enhanced_mock_analysis(self, message: str, fallback: bool = False,
+                                normalized_text: str = None) -> dict:
         """Mock analysis với scoring chi tiết"""
-        message_lower = message.lower()
-        
-        # Phân tích từ khóa với trọng số
-        spam_keywords = {
-            'trúng giải': 0.9,
-            'vay tiền': 0.8, 
-            'khuyến mãi': 0.7,
-            'miễn phí': 0.6,
-            'click link': 0.9,
-            'chuyển khoản': 0.8,
-            'mã otp': 0.9,
-            'xác thực': 0.7,
-            'làm giàu': 0.8,
-            'đầu tư': 0.6,
-            'lợi nhuận': 0.7,
-            'cảnh báo': 0.8,
-            'tài khoản bị khóa': 0.9,
-            'nhấp vào đây': 0.8
-        }
+        if normalized_text is None:
+            normalized_text = preprocess_text(message)
         
-        legitimate_keywords = {
-            'xin chào': 0.3,
-            'cảm ơn': 0.2,
-            'meeting': 0.2,
-            'dự án': 0.2,
-            'báo cáo': 0.2,
-            'công ty': 0.3,
-            'hỗ trợ': 0.3,
-            'thông tin': 0.4
-        }
+        # Một lượt Aho–Corasick cho toàn bộ từ khóa (automaton build sẵn trong __init__)
+        matches = self.keyword_matcher.match_preprocessed(normalized_text)
         
         # Tính điểm spam
-        spam_score = 0.0
-        matched_spam_keywords = []
-        for keyword, weight in spam_keywords.items():
-            if keyword in message_lower:
-                spam_score += weight
-                matched_spam_keywords.append(keyword)
+        spam_matches = matches.get('spam', [])
+        spam_score = sum(weight for _, weight in spam_matches)
+        matched_spam_keywords = [keyword for keyword, _ in spam_matches]
         
         # Tính điểm legitimate  
-        legit_score = 0.0
-        matched_legit_keywords = []
-        for keyword, weight in legitimate_keywords.items():
-            if keyword in message_lower:
-                legit_score += weight
-                matched_legit_keywords.append(keyword)
+        legit_matches = matches.get('legitimate', [])
+        legit_score = sum(weight for _, weight in legit_matches)
+        matched_legit_keywords = [keyword for keyword, _ in legit_matches]
         
         # Normalize scores
         spam_score = min(spam_score, 1.0)
@@ -166,24 +327,86 @@ class LLMAnalyzer:
         }
         
     def _check_provider_health(self) -> Dict:
-        """Kiểm tra health của provider hiện tại"""
+        """Health của provider hiện tại, chỉ đọc snapshot từ prober nền (không gọi mạng)"""
         # FIX 1: Lấy provider mới nhất
         current_provider = self.config.LLM_PROVIDER.lower()
         
-        cached = self.health_monitor.get_cached_status(current_provider)
-        if cached:
-            return cached
-            
         api_key = self._get_api_key()
         if not api_key or api_key.startswith('your-'):
             return {'status': LLMProviderStatus.DOWN, 'error': 'No valid API key configured'}
-            
-        return self.health_monitor.check_provider_health(current_provider, api_key)
+        
+        snapshot = self.health_monitor.get_snapshot(current_provider)
+        if snapshot:
+            return snapshot
+        
+        # Chưa có kết quả probe → vẫn gọi provider, lỗi sẽ được fallback như bình thường
+        return {'status': LLMProviderStatus.UNKNOWN, 'error': 'Provider not probed yet'}
     
-    def _get_api_key(self) -> str:
-        """Lấy API key theo provider"""
-        # FIX 1: Lấy provider mới nhất
+    def reload_keyword_rules(self, rules: Dict[str, List[Dict]]) -> int:
+        """
+        Build lại keyword index từ rule trong DB ({rule_set: [{'keyword', 'weight', 'enabled'}, ...]})
+        Automaton mới được thay nguyên khối, message đang phân tích vẫn dùng index cũ đến hết
+        """
+        keywords = {
+            rule_set: {rule['keyword']: rule['weight'] for rule in rule_list if rule.get('enabled', True)}
+            for rule_set, rule_list in rules.items()
+        }
+        self.keyword_matcher.set_keywords(keywords)
+        return self.keyword_matcher.keyword_count
+    
+    @staticmethod
+    def _serialize_health_status(health_status: Dict) -> Dict:
+        # FIX 2: Đảm bảo health_status có thể chuyển đổi thành JSON
+        serializable_health_status = health_status.copy()
+        if 'status' in serializable_health_status and isinstance(serializable_health_status['status'], LLMProviderStatus):
+            serializable_health_status['status'] = serializable_health_status['status'].value
+        return serializable_health_status
+    
+    def _candidate_providers(self) -> List[str]:
+        """Provider có API key hợp lệ, provider đang chọn trong config đứng đầu (tie-breaker)"""
+        current_provider = self.config.LLM_PROVIDER.lower()
+        ordered = [current_provider] + [p for p in self.PROVIDER_ENDPOINTS if p != current_provider]
+        
+        candidates = []
+        for provider in ordered:
+            if provider not in self.PROVIDER_ENDPOINTS:
+                continue
+            api_key = self._get_api_key(provider)
+            if api_key and not api_key.startswith('your-'):
+                candidates.append(provider)
+        return candidates
+    
+    def _hedge_after_ms(self) -> Optional[float]:
+        hedge_after_ms = float(self.config.get('llm_hedge_after_ms', 0) or 0)
+        return hedge_after_ms if hedge_after_ms > 0 else None
+    
+    def get_routing_stats(self) -> Dict:
+        """Latency, tỉ lệ lỗi và circuit breaker theo provider"""
+        return self.router.get_stats()
+    
+    def start_health_probing(self, interval: float = 60):
+        """Bật prober nền cho mọi provider đã cấu hình API key"""
+        self.health_monitor.start_background_probing(self._health_probe_targets, interval)
+    
+    def stop_health_probing(self):
+        self.health_monitor.stop_background_probing()
+    
+    def _health_probe_targets(self) -> Dict[str, str]:
+        targets = {
+            provider: self._get_api_key(provider)
+            for provider in self.PROVIDER_ENDPOINTS
+            if self._get_api_key(provider)
+        }
+        # Provider đang chọn luôn được probe (kể cả chưa có key → DOWN)
         current_provider = self.config.LLM_PROVIDER.lower()
+        if current_provider in self.PROVIDER_ENDPOINTS:
+            targets.setdefault(current_provider, '')
+        return targets
+    
+    def _get_api_key(self, provider: str = None) -> str:
+        """Lấy API key theo provider (mặc định: provider hiện tại)"""
+        # FIX 1: Lấy provider mới nhất
+        current_provider = (provider or self.config.LLM_PROVIDER).lower()
 
         if current_provider == 'openai':
             return self.config.OPENAI_API_KEY
@@ -193,19 +416,25 @@ class LLMAnalyzer:
             return self.config.OPENROUTER_API_KEY
         return ""
     
-    def _log_error(self, error_type: str, message: str):
+    def _log_error(self, error_type: str, message: str, provider: str):
         """Log lỗi để tracking"""
         self.error_log.append({
             'timestamp': datetime.now().isoformat(),
             'type': error_type,
             'message': message,
-            'provider': self.provider
+            'provider': provider
         })
         
         # Chỉ giữ 50 errors gần nhất
         if len(self.error_log) > 50:
             self.error_log = self.error_log[-50:]
     
+    def get_cache_stats(self) -> Dict:
+        """Thống kê hit/miss của verdict cache"""
+        if self.verdict_cache is None:
+            return {'enabled': False}
+        return {'enabled': True, **self.verdict_cache.get_stats()}
+    
     def get_error_summary(self) -> Dict:
         """Tổng hợp lỗi trong 24h qua"""
         now = datetime.now()
@@ -224,6 +453,15 @@ class LLMAnalyzer:
             'recent_errors': recent_errors[-5:]  # 5 lỗi gần nhất
         }
     
+    # Khối hướng dẫn dùng chung cho prompt đơn và prompt batch
+    ANALYSIS_FACTORS = """Consider these factors:
+- Urgent money requests
+- Suspicious links or downloads
+- Too-good-to-be-true offers
+- Requests for personal information
+- Grammar and spelling patterns
+- Social engineering tactics"""
+    
     def _create_prompt(self, message: str) -> str:
         """Tạo prompt cho LLM"""
         return f"""
@@ -239,108 +477,69 @@ Please analyze and respond in JSON format:
     "classification": "legitimate/suspicious/spam"
 }}
 
-Consider these factors:
-- Urgent money requests
-- Suspicious links or downloads
-- Too-good-to-be-true offers
-- Requests for personal information
-- Grammar and spelling patterns
-- Social engineering tactics
+{self.ANALYSIS_FACTORS}
 
 Response (JSON only):
 """
     
-    def _analyze_with_openai(self, message: str) -> dict:
-        """Phân tích bằng OpenAI API"""
-        url = "https://api.openai.com/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {self.config.OPENAI_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": "gpt-3.5-turbo",
-            "messages": [
-                {"role": "user", "content": self._create_prompt(message)}
-            ],
-            "max_tokens": 200,
-            "temperature": 0.3
-        }
-        
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
-        response.raise_for_status()
-        
-        result = response.json()
-        content = result['choices'][0]['message']['content']
-        
-        return self._parse_llm_response(content)
+    def _create_batch_prompt(self, messages: List[str]) -> str:
+        """Tạo một prompt cho nhiều message, hướng dẫn chỉ lặp lại một lần"""
+        numbered_messages = "\n".join(
+            f"[{index}] {json.dumps(message, ensure_ascii=False)}"
+            for index, message in enumerate(messages)
+        )
+        return f"""
+Analyze each of the following {len(messages)} Vietnamese messages independently for spam/scam detection:
+
+{numbered_messages}
+
+Please respond with a JSON array containing exactly one object per message:
+[
+    {{
+        "index": message number,
+        "is_spam": true/false,
+        "confidence": 0.0-1.0,
+        "reason": "explanation in Vietnamese",
+        "classification": "legitimate/suspicious/spam"
+    }}
+]
+
+{self.ANALYSIS_FACTORS}
+
+Response (JSON array only):
+"""
     
-    def _analyze_with_groq(self, message: str) -> dict:
-        """Phân tích bằng Groq API"""
-        url = "https://api.groq.com/openai/v1/chat/completions"
+    def _chat_completion(self, provider: str, prompt: str, max_tokens: int = None) -> str:
+        """Gọi chat completion của provider, trả về nội dung text"""
+        endpoint = self.PROVIDER_ENDPOINTS[provider]
         headers = {
-            "Authorization": f"Bearer {self.config.GROQ_API_KEY}",
-            "Content-Type": "application/json"
+            "Authorization": f"Bearer {self._get_api_key(provider)}",
+            "Content-Type": "application/json",
+            **endpoint['headers']
         }
         
         payload = {
-            "model": "openai/gpt-oss-120b",
+            "model": endpoint['model'],
             "messages": [
-                {"role": "user", "content": self._create_prompt(message)}
+                {"role": "user", "content": prompt}
             ],
-            "max_tokens": 200,
+            "max_tokens": max_tokens or self.MAX_TOKENS_PER_VERDICT,
             "temperature": 0.3
         }
         
-        print(f"🔄 Calling Groq API with model: {payload['model']}")
-    
-        try:
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
-            print(f"📡 Groq Response Status: {response.status_code}")
-            
-            if response.status_code != 200:
-                print(f"❌ Groq Error Response: {response.text}")
-                
-            response.raise_for_status()
-            
-            result = response.json()
-            content = result['choices'][0]['message']['content']
-            print(f"✅ Groq Raw Response: {content[:200]}...")
-            
-            return self._parse_llm_response(content)
-            
-        except requests.exceptions.RequestException as e:
-            print(f"❌ Groq Request Error: {e}")
-            raise
-        except Exception as e:
-            print(f"❌ Groq Processing Error: {e}")
-            raise
-    
-    def _analyze_with_openrouter(self, message: str) -> dict:
-        """Phân tích bằng OpenRouter API"""
-        url = "https://openrouter.ai/api/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {self.config.OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "http://localhost:5000",
-            "X-Title": "Spam Filter Demo"
-        }
+        response = self.http.post(provider, endpoint['url'], headers=headers, json=payload)
         
-        payload = {
-            "model": "meta-llama/llama-3.3-70b-instruct:free",
-            "messages": [
-                {"role": "user", "content": self._create_prompt(message)}
-            ],
-            "max_tokens": 200,
-            "temperature": 0.3
-        }
+        if response.status_code != 200:
+            print(f"❌ {provider} Error Response ({response.status_code}): {response.text[:200]}")
         
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
         response.raise_for_status()
         
         result = response.json()
-        content = result['choices'][0]['message']['content']
-        
+        return result['choices'][0]['message']['content']
+    
+    def _analyze_with_provider(self, provider: str, message: str) -> dict:
+        """Phân tích một message bằng API của provider"""
+        content = self._chat_completion(provider, self._create_prompt(message))
         return self._parse_llm_response(content)
     
     def _parse_llm_response(self, content: str) -> dict:
@@ -373,5 +572,43 @@ Response (JSON only):
                 'is_spam': True,
                 'confidence': 0.5,
                 'reason': 'Không thể phân tích response từ LLM',
-                'classification': 'suspicious'
-            }
\ No newline at end of file
+                'classification': 'suspicious',
+                'parse_error': True
+            }
+    
+    def _parse_batch_llm_response(self, content: str, expected_count: int) -> List[Optional[dict]]:
+        """
+        Parse JSON array từ response batch, map kết quả về theo index
+        Returns: list dài expected_count, phần tử None nếu message đó không parse được
+        """
+        verdicts = [None] * expected_count
+        required_fields = ['is_spam', 'confidence', 'reason', 'classification']
+        
+        try:
+            start = content.find('[')
+            end = content.rfind(']') + 1
+            if start == -1 or end == 0:
+                raise ValueError("No JSON array found in response")
+            
+            items = json.loads(content[start:end])
+            if not isinstance(items, list):
+                raise ValueError("Response is not a JSON array")
+        except Exception as e:
+            print(f"Error parsing batch LLM response: {e}")
+            print(f"Raw content: {content[:500]}")
+            return verdicts
+        
+        for position, item in enumerate(items):
+            if not isinstance(item, dict):
+                continue
+            if any(field not in item for field in required_fields):
+                continue
+            
+            # Ưu tiên index do LLM trả về, thiếu thì dùng vị trí trong mảng
+            index = item.pop('index', position)
+            if not isinstance(index, int) or not 0 <= index < expected_count:
+                continue
+            if verdicts[index] is None:
+                verdicts[index] = item
+        
+        return verdicts
@@ -1,9 +1,11 @@
+import threading
 import time
-import requests
 from enum import Enum
-from typing import Dict, Optional
+from typing import Callable, Dict, Optional
 from datetime import datetime, timedelta
 
+from .http_pool import ProviderSessionPool
+
 class LLMProviderStatus(Enum):
     HEALTHY = "healthy"
     DEGRADED = "degraded"
@@ -11,11 +13,70 @@ class LLMProviderStatus(Enum):
     UNKNOWN = "unknown"
 
 class LLMHealthMonitor:
-    def __init__(self):
+    HEALTH_READ_TIMEOUT = 10  # Giây chờ response của endpoint /models
+    
+    def __init__(self, http_pool: ProviderSessionPool = None):
+        self.http = http_pool or ProviderSessionPool()
         self.last_checks = {}
         self.status_cache = {}
         self.error_counts = {}
         self.response_times = {}
+        self._probe_thread = None
+        self._probe_stop = threading.Event()
+        # Chỉ writer giữ lock (prober và lỗi báo inline có thể publish cùng lúc); reader không cần
+        self._publish_lock = threading.Lock()
+    
+    def start_background_probing(self, get_targets: Callable[[], Dict[str, str]], interval: float = 60):
+        """
+        Probe định kỳ các provider trong thread nền
+        get_targets() -> {provider: api_key} của các provider đã cấu hình
+        """
+        if self._probe_thread and self._probe_thread.is_alive():
+            return
+        
+        self._probe_stop.clear()
+        self._probe_thread = threading.Thread(
+            target=self._probe_loop, args=(get_targets, interval), name='llm-health-prober'
+        )
+        self._probe_thread.daemon = True
+        self._probe_thread.start()
+        print(f"LLM health prober started (every {interval}s)")
+    
+    def stop_background_probing(self):
+        self._probe_stop.set()
+        if self._probe_thread:
+            self._probe_thread.join()
+            self._probe_thread = None
+    
+    def _probe_loop(self, get_targets: Callable[[], Dict[str, str]], interval: float):
+        # Probe ngay khi khởi động rồi lặp theo chu kỳ
+        while not self._probe_stop.is_set():
+            try:
+                for provider, api_key in get_targets().items():
+                    if self._probe_stop.is_set():
+                        break
+                    if not api_key or api_key.startswith('your-'):
+                        self._publish(provider, {
+                            'status': LLMProviderStatus.DOWN,
+                            'error': 'No valid API key configured',
+                            'checked_at': datetime.now().isoformat()
+                        })
+                        continue
+                    self.check_provider_health(provider, api_key)
+            except Exception as e:
+                print(f"❌ Error in health prober: {e}")
+            
+            self._probe_stop.wait(interval)
+    
+    def _publish(self, provider: str, result: Dict):
+        # Copy-on-write: thay cả dict → reader trên hot path luôn thấy snapshot nhất quán, không cần lock
+        with self._publish_lock:
+            self.status_cache = {**self.status_cache, provider: result}
+            self.last_checks = {**self.last_checks, provider: datetime.now()}
+    
+    def get_snapshot(self, provider: str) -> Optional[Dict]:
+        """Kết quả probe gần nhất của provider (không gọi mạng), None nếu chưa probe"""
+        return self.status_cache.get(provider)
         
     def check_provider_health(self, provider: str, api_key: str) -> Dict:
         """Kiểm tra health của LLM provider"""
@@ -48,8 +109,7 @@ class LLMHealthMonitor:
         result['checked_at'] = datetime.now().isoformat()
         
         # Update cache
-        self.status_cache[provider] = result
-        self.last_checks[provider] = datetime.now()
+        self._publish(provider, result)
         
         return result
     
@@ -58,7 +118,7 @@ class LLMHealthMonitor:
         url = "https://api.openai.com/v1/models"
         headers = {"Authorization": f"Bearer {api_key}"}
         
-        response = requests.get(url, headers=headers, timeout=10)
+        response = self.http.get('openai', url, headers=headers, timeout=self._timeout())
         
         if response.status_code == 200:
             models = response.json().get('data', [])
@@ -89,7 +149,7 @@ class LLMHealthMonitor:
         url = "https://api.groq.com/openai/v1/models"
         headers = {"Authorization": f"Bearer {api_key}"}
         
-        response = requests.get(url, headers=headers, timeout=10)
+        response = self.http.get('groq', url, headers=headers, timeout=self._timeout())
         
         if response.status_code == 200:
             models = response.json().get('data', [])
@@ -118,7 +178,7 @@ class LLMHealthMonitor:
         url = "https://openrouter.ai/api/v1/models"
         headers = {"Authorization": f"Bearer {api_key}"}
         
-        response = requests.get(url, headers=headers, timeout=10)
+        response = self.http.get('openrouter', url, headers=headers, timeout=self._timeout())
         
         if response.status_code == 200:
             return {
@@ -132,6 +192,9 @@ class LLMHealthMonitor:
                 'details': {'status_code': response.status_code}
             }
     
+    def _timeout(self) -> tuple:
+        return (self.http.connect_timeout, self.HEALTH_READ_TIMEOUT)
+    
     def get_cached_status(self, provider: str) -> Optional[Dict]:
         """Lấy status đã cache (trong vòng 5 phút)"""
         if provider not in self.last_checks:
@@ -0,0 +1,243 @@
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from enum import Enum
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .llm_health import LLMHealthMonitor, LLMProviderStatus
+
+
+class CircuitState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Mở mạch sau failure_threshold lỗi liên tiếp, thử lại một request sau reset_timeout giây"""
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CircuitState.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+    
+    def is_available(self) -> bool:
+        """Có thể gửi request không (chỉ kiểm tra, không chiếm lượt thử)"""
+        with self._lock:
+            if self.state == CircuitState.CLOSED:
+                return True
+            if self.state == CircuitState.OPEN:
+                return time.time() - self.opened_at >= self.reset_timeout
+            return not self._trial_in_flight
+    
+    def acquire(self) -> bool:
+        """Chiếm quyền gửi request; ở trạng thái half-open chỉ một request thử được đi"""
+        with self._lock:
+            if self.state == CircuitState.OPEN:
+                if time.time() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = CircuitState.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == CircuitState.HALF_OPEN:
+                if self._trial_in_flight:
+                    return False
+                self._trial_in_flight = True
+            return True
+    
+    def record_success(self):
+        with self._lock:
+            self.state = CircuitState.CLOSED
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+    
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_in_flight = False
+            if (self.state == CircuitState.HALF_OPEN
+                    or self.consecutive_failures >= self.failure_threshold):
+                if self.state != CircuitState.OPEN:
+                    print(f"⚡ Circuit opened after {self.consecutive_failures} failures")
+                self.state = CircuitState.OPEN
+                self.opened_at = time.time()
+
+
+class LLMRouter:
+    """
+    Chọn provider nhanh nhất còn khỏe cho mỗi request
+    Theo dõi latency/tỉ lệ lỗi cuốn chiếu (ghi vào response_times/error_counts của LLMHealthMonitor),
+    circuit breaker theo provider và tùy chọn hedge request chậm sang provider thứ hai.
+    """
+    
+    ERROR_RATE_PENALTY = 4.0  # Điểm = latency trung vị * (1 + penalty * tỉ lệ lỗi)
+    
+    def __init__(self, health_monitor: LLMHealthMonitor, window: int = 50,
+                 failure_threshold: int = 5, reset_timeout: float = 30, max_hedges: int = 4):
+        self.health_monitor = health_monitor
+        self.window = window
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._outcomes: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        # Thread riêng cho request hedge, tách khỏi pool của LLM stage
+        self._hedge_executor = ThreadPoolExecutor(max_workers=max_hedges, thread_name_prefix='llm-hedge')
+    
+    def _breaker(self, provider: str) -> CircuitBreaker:
+        breaker = self.breakers.get(provider)
+        if breaker is None:
+            with self._lock:
+                breaker = self.breakers.setdefault(
+                    provider, CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                )
+        return breaker
+    
+    def record_result(self, provider: str, latency_ms: float, success: bool):
+        """Cập nhật thống kê cuốn chiếu và circuit breaker của provider"""
+        with self._lock:
+            outcomes = self._outcomes.setdefault(provider, deque(maxlen=self.window))
+            outcomes.append(success)
+            if success:
+                latencies = self.health_monitor.response_times.setdefault(provider, deque(maxlen=self.window))
+                latencies.append(latency_ms)
+            self.health_monitor.error_counts[provider] = outcomes.count(False)
+        
+        if success:
+            self._breaker(provider).record_success()
+        else:
+            self._breaker(provider).record_failure()
+    
+    def _latency_prior(self) -> float:
+        """Trung vị latency của các provider đã có số liệu (0 nếu chưa provider nào có)"""
+        with self._lock:
+            medians = [
+                statistics.median(latencies)
+                for latencies in list(self.health_monitor.response_times.values()) if latencies
+            ]
+        return statistics.median(medians) if medians else 0.0
+    
+    def _score(self, provider: str, prior: float = 0.0) -> float:
+        with self._lock:
+            latencies = list(self.health_monitor.response_times.get(provider, ()))
+            outcomes = self._outcomes.get(provider)
+            error_rate = outcomes.count(False) / len(outcomes) if outcomes else 0.0
+        
+        if not latencies:
+            # Chưa có số liệu → điểm trung lập (prior): không vượt provider đã chạy tốt, hòa thì thứ tự
+            # candidates (provider đang cấu hình trước) quyết định; chỉ toàn lỗi → xếp cuối
+            return float('inf') if outcomes else prior
+        median_latency = statistics.median(latencies)
+        return median_latency * (1 + self.ERROR_RATE_PENALTY * error_rate)
+    
+    def rank_providers(self, candidates: List[str]) -> List[str]:
+        """Provider dùng được, nhanh nhất trước (thứ tự candidates làm tie-breaker)"""
+        prior = self._latency_prior()
+        available = []
+        for order, provider in enumerate(candidates):
+            snapshot = self.health_monitor.get_snapshot(provider)
+            if snapshot and snapshot['status'] in (LLMProviderStatus.DOWN, LLMProviderStatus.DEGRADED):
+                continue
+            if not self._breaker(provider).is_available():
+                continue
+            available.append((self._score(provider, prior), order, provider))
+        
+        return [provider for _, _, provider in sorted(available)]
+    
+    def _timed_call(self, provider: str, call: Callable[[str], object]):
+        start_time = time.time()
+        try:
+            result = call(provider)
+        except Exception:
+            self.record_result(provider, (time.time() - start_time) * 1000, False)
+            raise
+        self.record_result(provider, (time.time() - start_time) * 1000, True)
+        return result
+    
+    def execute(self, candidates: List[str], call: Callable[[str], object],
+                hedge_after_ms: Optional[float] = None) -> Tuple[str, object]:
+        """
+        Gọi call(provider) trên provider tốt nhất, lỗi thì chuyển sang provider kế tiếp
+        hedge_after_ms: quá thời gian này chưa xong → gửi song song sang provider thứ hai, lấy kết quả về trước
+        Returns: (provider, kết quả). Raise lỗi cuối cùng nếu mọi provider đều lỗi.
+        """
+        ranked = self.rank_providers(candidates)
+        if not ranked:
+            raise RuntimeError(f"No healthy LLM provider available (candidates: {candidates})")
+        
+        if hedge_after_ms and len(ranked) > 1:
+            return self._execute_hedged(ranked, call, hedge_after_ms / 1000)
+        
+        last_error = None
+        for provider in ranked:
+            if not self._breaker(provider).acquire():
+                continue
+            try:
+                return provider, self._timed_call(provider, call)
+            except Exception as e:
+                print(f"⚠️ Provider {provider} failed, trying next: {e}")
+                last_error = e
+        
+        raise last_error or RuntimeError("All LLM provider circuits are open")
+    
+    def _execute_hedged(self, ranked: List[str], call: Callable[[str], object], hedge_after: float):
+        remaining = list(ranked)
+        in_flight = {}
+        last_error = None
+        
+        def launch_next() -> bool:
+            while remaining:
+                provider = remaining.pop(0)
+                if self._breaker(provider).acquire():
+                    in_flight[self._hedge_executor.submit(self._timed_call, provider, call)] = provider
+                    return True
+            return False
+        
+        launch_next()
+        while in_flight:
+            # Chỉ chờ hedge_after khi còn provider dự phòng để hedge
+            done, _ = wait(list(in_flight), timeout=hedge_after if remaining else None,
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                print(f"⏱️ Hedging slow LLM request to {remaining[0]}")
+                launch_next()
+                continue
+            
+            for future in done:
+                provider = in_flight.pop(future)
+                try:
+                    # Request còn lại (nếu có) chạy nốt trong nền, chỉ để cập nhật thống kê
+                    return provider, future.result()
+                except Exception as e:
+                    print(f"⚠️ Provider {provider} failed, trying next: {e}")
+                    last_error = e
+            
+            if not in_flight:
+                launch_next()
+        
+        raise last_error or RuntimeError("All LLM provider circuits are open")
+    
+    def get_stats(self) -> Dict:
+        """Latency trung vị, tỉ lệ lỗi và trạng thái circuit của từng provider"""
+        stats = {}
+        with self._lock:
+            providers = set(self._outcomes) | set(self.breakers)
+        
+        for provider in sorted(providers):
+            with self._lock:
+                latencies = list(self.health_monitor.response_times.get(provider, ()))
+                outcomes = list(self._outcomes.get(provider, ()))
+            breaker = self._breaker(provider)
+            stats[provider] = {
+                'median_latency_ms': round(statistics.median(latencies), 1) if latencies else None,
+                'requests_in_window': len(outcomes),
+                'error_rate': round(outcomes.count(False) / len(outcomes), 3) if outcomes else 0.0,
+                'circuit_state': breaker.state.value,
+                'consecutive_failures': breaker.consecutive_failures
+            }
+        return stats
@@ -0,0 +1,166 @@
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.pipeline import Pipeline
+
+
+class ModelArtifact:
+    """
+    Model Naive Bayes lưu dạng thư mục các mảng NumPy (.npy) + meta.json, thay cho pickle
+
+    models/nb_model/
+        CURRENT                 # tên thư mục version đang dùng, đổi bằng os.replace (nguyên tử)
+        v000003/
+            meta.json           # format, version, hash dữ liệu train, tham số vectorizer/NB
+            vocabulary.npy      # term theo thứ tự cột (unicode cố định độ dài)
+            idf.npy
+            feature_log_prob.npy, class_log_prior.npy
+            feature_count.npy, class_count.npy   # giữ lại để cập nhật tăng dần
+
+    Mảng được np.load(mmap_mode='r') → nhiều worker process dùng chung page cache,
+    load không phải unpickle cả Pipeline.
+    """
+
+    FORMAT_VERSION = 1
+    CURRENT_FILE = 'CURRENT'
+    META_FILE = 'meta.json'
+    # Tham số TfidfVectorizer cần lưu để dựng lại đúng cách tokenize/weighting
+    VECTORIZER_PARAMS = ('ngram_range', 'max_features', 'lowercase', 'token_pattern',
+                         'norm', 'use_idf', 'smooth_idf', 'sublinear_tf')
+    ARRAYS = ('vocabulary', 'idf', 'feature_log_prob', 'class_log_prior', 'feature_count', 'class_count')
+    KEEP_VERSIONS = 3  # Số version cũ giữ lại (process khác có thể vẫn đang mmap)
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def current_version_dir(self) -> Optional[str]:
+        """Thư mục version đang dùng, None nếu chưa có artifact"""
+        try:
+            with open(os.path.join(self.path, self.CURRENT_FILE), 'r', encoding='utf-8') as f:
+                version_name = f.read().strip()
+        except FileNotFoundError:
+            return None
+        version_dir = os.path.join(self.path, version_name)
+        return version_dir if os.path.isdir(version_dir) else None
+
+    def exists(self) -> bool:
+        return self.current_version_dir() is not None
+
+    def read_meta(self) -> Optional[Dict]:
+        version_dir = self.current_version_dir()
+        if version_dir is None:
+            return None
+        with open(os.path.join(version_dir, self.META_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, pipeline: Pipeline, training_data_hash: str = None, extra_meta: Dict = None) -> Dict:
+        """Ghi pipeline đã train thành version mới rồi trỏ CURRENT sang (reader cũ không bị ảnh hưởng)"""
+        vectorizer = pipeline.named_steps['tfidf']
+        nb = pipeline.named_steps['nb']
+
+        terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+        arrays = {
+            'vocabulary': np.array(terms, dtype=str),
+            'idf': np.asarray(vectorizer.idf_, dtype=np.float64),
+            'feature_log_prob': np.asarray(nb.feature_log_prob_, dtype=np.float64),
+            'class_log_prior': np.asarray(nb.class_log_prior_, dtype=np.float64),
+            'feature_count': np.asarray(nb.feature_count_, dtype=np.float64),
+            'class_count': np.asarray(nb.class_count_, dtype=np.float64),
+        }
+
+        previous = self.read_meta()
+        version = (previous['version'] + 1) if previous else 1
+        meta = {
+            'format_version': self.FORMAT_VERSION,
+            'version': version,
+            'created_at': datetime.now().isoformat(),
+            'training_data_sha256': training_data_hash,
+            'classes': [int(c) for c in nb.classes_],
+            'n_features': len(terms),
+            'vectorizer': {
+                name: list(value) if isinstance(value, tuple) else value
+                for name, value in ((name, getattr(vectorizer, name)) for name in self.VECTORIZER_PARAMS)
+            },
+            'nb': {'alpha': nb.alpha},
+            'arrays': {name: {'dtype': str(a.dtype), 'shape': list(a.shape)} for name, a in arrays.items()},
+            **(extra_meta or {})
+        }
+
+        os.makedirs(self.path, exist_ok=True)
+        version_name = f'v{version:06d}'
+        tmp_dir = os.path.join(self.path, f'.{version_name}.tmp-{os.getpid()}')
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), array, allow_pickle=False)
+        with open(os.path.join(tmp_dir, self.META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_dir, os.path.join(self.path, version_name))
+
+        # Đổi con trỏ CURRENT nguyên tử: reader thấy version cũ hoặc mới, không bao giờ thấy nửa chừng
+        current_tmp = os.path.join(self.path, f'.{self.CURRENT_FILE}.tmp-{os.getpid()}')
+        with open(current_tmp, 'w', encoding='utf-8') as f:
+            f.write(version_name)
+        os.replace(current_tmp, os.path.join(self.path, self.CURRENT_FILE))
+
+        self._prune_old_versions(version_name)
+        meta['artifact_dir'] = os.path.join(self.path, version_name)
+        return meta
+
+    def _prune_old_versions(self, current_name: str):
+        versions = sorted(
+            name for name in os.listdir(self.path)
+            if name.startswith('v') and os.path.isdir(os.path.join(self.path, name))
+        )
+        for name in versions[:-(self.KEEP_VERSIONS + 1)]:
+            if name != current_name:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+    def load_arrays(self, mmap: bool = True) -> Tuple[Dict, Dict[str, np.ndarray]]:
+        """(meta, {tên: mảng}) của version hiện tại; mảng là memmap chỉ đọc khi mmap=True"""
+        version_dir = self.current_version_dir()
+        if version_dir is None:
+            raise FileNotFoundError(f"No model artifact in {self.path}")
+
+        with open(os.path.join(version_dir, self.META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('format_version') != self.FORMAT_VERSION:
+            raise ValueError(f"Unsupported model artifact format: {meta.get('format_version')}")
+        meta['artifact_dir'] = version_dir
+
+        arrays = {
+            name: np.load(os.path.join(version_dir, f'{name}.npy'),
+                          mmap_mode='r' if mmap else None, allow_pickle=False)
+            for name in self.ARRAYS
+        }
+        return meta, arrays
+
+    def load_pipeline(self, mmap: bool = True) -> Tuple[Pipeline, Dict]:
+        """Dựng lại sklearn Pipeline (TF-IDF + MultinomialNB) từ mảng, không cần fit lại"""
+        start_time = time.time()
+        meta, arrays = self.load_arrays(mmap)
+
+        vectorizer_params = dict(meta['vectorizer'])
+        vectorizer_params['ngram_range'] = tuple(vectorizer_params['ngram_range'])
+        vocabulary = {str(term): index for index, term in enumerate(arrays['vocabulary'])}
+        vectorizer = TfidfVectorizer(vocabulary=vocabulary, **vectorizer_params)
+        vectorizer.idf_ = arrays['idf']
+
+        nb = MultinomialNB(alpha=meta['nb']['alpha'])
+        nb.classes_ = np.array(meta['classes'])
+        nb.feature_log_prob_ = arrays['feature_log_prob']
+        nb.class_log_prior_ = arrays['class_log_prior']
+        nb.feature_count_ = arrays['feature_count']
+        nb.class_count_ = arrays['class_count']
+        nb.n_features_in_ = meta['n_features']
+
+        pipeline = Pipeline([('tfidf', vectorizer), ('nb', nb)])
+        meta['load_time_ms'] = round((time.time() - start_time) * 1000, 2)
+        return pipeline, meta
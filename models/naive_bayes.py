@@ -1,30 +1,59 @@
+import hashlib
 import json
 import pickle
 import os
+from collections import namedtuple
+import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.pipeline import Pipeline
-import re
+
+from .model_artifact import ModelArtifact
+from .nb_scorer import NBScorer
+from .preprocessing import preprocess_text
+
+# Pipeline, scorer và meta luôn đi cùng nhau; thay cả tuple = swap model nguyên tử
+_ModelState = namedtuple('_ModelState', ['pipeline', 'scorer', 'meta'])
 
 class NaiveBayesFilter:
-    def __init__(self, model_path: str = 'models/nb_model.pkl'):
+    LEGACY_PICKLE_PATH = 'models/nb_model.pkl'  # Format cũ, chỉ đọc một lần để chuyển sang artifact
+    FAST_SCORER_MAX_BATCH = 16  # Batch lớn hơn thì predict_proba vector hóa của sklearn nhanh hơn
+    PARITY_TOLERANCE = 1e-9  # Sai khác xác suất tối đa cho phép giữa NBScorer và sklearn
+    
+    def __init__(self, model_path: str = 'models/nb_model',
+                 training_data_path: str = 'data/training_data.json',
+                 use_fast_scorer: bool = True):
         self.model_path = model_path
-        self.pipeline = None
+        self.training_data_path = training_data_path
+        self.artifact = ModelArtifact(model_path)
+        self.use_fast_scorer = use_fast_scorer
+        self._model = _ModelState(None, None, None)
         self.load_or_train_model()
     
-    def preprocess_text(self, text: str) -> str:
-        """Tiền xử lý văn bản tiếng Việt"""
-        # Chuyển về chữ thường
-        text = text.lower()
-        # Loại bỏ ký tự đặc biệt, giữ lại chữ cái và số
-        text = re.sub(r'[^\w\s]', ' ', text)
-        # Loại bỏ khoảng trắng thừa
-        text = re.sub(r'\s+', ' ', text).strip()
-        return text
+    @property
+    def pipeline(self):
+        return self._model.pipeline
+    
+    @property
+    def scorer(self):
+        return self._model.scorer
+    
+    @property
+    def model_meta(self):
+        return self._model.meta
+    
+    def _install(self, pipeline, meta):
+        """Đưa model mới vào dùng bằng một phép gán; predict đang chạy vẫn dùng model cũ đến hết"""
+        self._model = _ModelState(pipeline, self._build_scorer(pipeline), meta)
+    
+    @staticmethod
+    def preprocess_text(text: str) -> str:
+        """Tiền xử lý văn bản tiếng Việt (NFC, chữ thường, bỏ ký tự đặc biệt), xem models/preprocessing.py"""
+        return preprocess_text(text)
     
     def load_training_data(self) -> tuple:
         """Load dữ liệu training từ file JSON"""
-        with open('data/training_data.json', 'r', encoding='utf-8') as f:
+        with open(self.training_data_path, 'r', encoding='utf-8') as f:
             data = json.load(f)
         
         texts = []
@@ -54,7 +83,7 @@ class NaiveBayesFilter:
         texts, labels = self.load_training_data()
         
         # Tạo pipeline: TF-IDF + Naive Bayes
-        self.pipeline = Pipeline([
+        pipeline = Pipeline([
             ('tfidf', TfidfVectorizer(
                 max_features=1000,
                 ngram_range=(1, 2),
@@ -64,30 +93,120 @@ class NaiveBayesFilter:
         ])
         
         # Train model
-        self.pipeline.fit(texts, labels)
+        pipeline.fit(texts, labels)
         
-        # Lưu model
-        os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
-        with open(self.model_path, 'wb') as f:
-            pickle.dump(self.pipeline, f)
+        # Lưu model thành artifact version mới
+        meta = self.artifact.save(pipeline, self.training_data_hash())
+        print(f"Model v{meta['version']} saved to {self.model_path}")
+        self._install(pipeline, meta)
+    
+    def partial_fit(self, texts: list, labels: list, preprocessed: bool = False) -> dict:
+        """
+        Cập nhật tăng dần model hiện tại bằng MultinomialNB.partial_fit (vocabulary và IDF giữ nguyên)
+        Model mới được lưu thành artifact version mới rồi mới swap vào; model cũ không bị sửa tại chỗ
+        Returns: meta của version mới
+        """
+        model = self._model
+        if not model.pipeline:
+            raise Exception("Model chưa được load hoặc train")
+        
+        processed_texts = texts if preprocessed else [self.preprocess_text(text) for text in texts]
+        vectorizer = model.pipeline.named_steps['tfidf']
+        current_nb = model.pipeline.named_steps['nb']
+        
+        # Mảng của model đang dùng là memmap chỉ đọc → học trên bản copy
+        nb = MultinomialNB(alpha=current_nb.alpha, fit_prior=current_nb.fit_prior,
+                           class_prior=current_nb.class_prior)
+        for attribute in ('classes_', 'class_count_', 'feature_count_', 'feature_log_prob_', 'class_log_prior_'):
+            setattr(nb, attribute, np.array(getattr(current_nb, attribute)))
+        nb.n_features_in_ = current_nb.n_features_in_
+        nb.partial_fit(vectorizer.transform(processed_texts), labels)
         
-        print(f"Model saved to {self.model_path}")
+        meta = self.artifact.save(
+            Pipeline([('tfidf', vectorizer), ('nb', nb)]),
+            model.meta.get('training_data_sha256'),
+            extra_meta={
+                'base_version': model.meta['version'],
+                'incremental_samples': model.meta.get('incremental_samples', 0) + len(processed_texts)
+            }
+        )
+        print(f"Model v{meta['version']} updated incrementally with {len(processed_texts)} reviewed messages")
+        # Nạp lại từ artifact → dùng chung page cache với các process khác
+        self.load_model()
+        return meta
+    
+    def reload_if_changed(self) -> bool:
+        """Nạp version mới nếu process khác đã ghi artifact (so sánh con trỏ CURRENT)"""
+        current_dir = self.artifact.current_version_dir()
+        if current_dir is None or current_dir == (self.model_meta or {}).get('artifact_dir'):
+            return False
+        return self.load_model()
+    
+    def _build_scorer(self, pipeline):
+        """Xuất NBScorer từ pipeline, chỉ dùng khi cho kết quả trùng sklearn"""
+        if not self.use_fast_scorer:
+            return None
+        
+        try:
+            scorer = NBScorer.from_pipeline(pipeline)
+        except ValueError as e:
+            print(f"⚠️ Fast NB scorer disabled: {e}")
+            return None
+        
+        # Parity: message giả ghép từ các term trong vocabulary (có cả n-gram và term lặp lại)
+        terms = sorted(scorer.vocabulary, key=scorer.vocabulary.get)
+        samples = ['', 'zzz'] + [' '.join(terms[i:i + 7] * 2) for i in range(0, min(len(terms), 210), 7)]
+        difference = scorer.max_abs_difference(pipeline, samples)
+        if difference > self.PARITY_TOLERANCE:
+            print(f"⚠️ Fast NB scorer disabled: differs from sklearn by {difference:.2e}")
+            return None
+        
+        return scorer
+    
+    def training_data_hash(self) -> str:
+        """SHA-256 của file training data (ghi vào meta để biết model train từ dữ liệu nào)"""
+        try:
+            with open(self.training_data_path, 'rb') as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except FileNotFoundError:
+            return None
     
     def load_model(self):
-        """Load model đã train"""
+        """Load model từ artifact (mảng NumPy memory-mapped), không unpickle"""
         try:
-            with open(self.model_path, 'rb') as f:
-                self.pipeline = pickle.load(f)
-            print(f"Model loaded from {self.model_path}")
-            return True
+            pipeline, meta = self.artifact.load_pipeline()
         except FileNotFoundError:
-            print(f"Model file not found: {self.model_path}")
+            print(f"Model artifact not found: {self.model_path}")
+            return False
+        
+        print(f"Model v{meta['version']} loaded from {self.model_path} in {meta['load_time_ms']} ms")
+        self._install(pipeline, meta)
+        # Model chuyển từ pickle cũ không có hash → không so sánh được
+        trained_hash = meta.get('training_data_sha256')
+        if trained_hash and trained_hash != self.training_data_hash():
+            print(f"⚠️ {self.training_data_path} changed since model v{meta['version']} was trained, "
+                  f"run train_model() to refresh")
+        return True
+    
+    def _convert_legacy_pickle(self) -> bool:
+        """Chuyển nb_model.pkl cũ sang artifact (một lần) thay vì train lại"""
+        if not os.path.exists(self.LEGACY_PICKLE_PATH):
             return False
+        
+        with open(self.LEGACY_PICKLE_PATH, 'rb') as f:
+            pipeline = pickle.load(f)
+        self.artifact.save(pipeline, extra_meta={'converted_from': self.LEGACY_PICKLE_PATH})
+        print(f"Converted legacy model {self.LEGACY_PICKLE_PATH} to {self.model_path}")
+        return self.load_model()
     
     def load_or_train_model(self):
-        """Load model hoặc train nếu chưa có"""
-        if not self.load_model():
-            self.train_model()
+        """Load model, chuyển từ pickle cũ hoặc train nếu chưa có artifact"""
+        if self.load_model() or self._convert_legacy_pickle():
+            return
+        
+        # Chỉ xảy ra lần chạy đầu tiên; nên train trước bằng run_.py để app khởi động không phải chờ
+        print("⏳ No trained model found, training now (blocks startup)...")
+        self.train_model()
     
     def predict(self, text: str) -> tuple:
         """
@@ -96,20 +215,44 @@ class NaiveBayesFilter:
         prediction: 0=legitimate, 1=suspicious, 2=spam
         probability_scores: [prob_legitimate, prob_suspicious, prob_spam]
         """
-        if not self.pipeline:
+        return self.predict_batch([text])[0]
+    
+    def predict_batch(self, texts: list, preprocessed: bool = False) -> list:
+        """
+        Dự đoán phân loại cho nhiều message cùng lúc
+        TF-IDF chỉ chạy một lần trên cả batch, prediction lấy argmax từ predict_proba
+        Batch nhỏ (≤ FAST_SCORER_MAX_BATCH) đi qua NBScorer, tránh overhead validate của sklearn
+        preprocessed=True: texts đã qua preprocess_text (tránh tiền xử lý lại)
+        Returns: [(prediction, probability_scores), ...] theo đúng thứ tự đầu vào
+        """
+        model = self._model  # Cả batch dùng cùng một model dù có swap giữa chừng
+        if not model.pipeline:
             raise Exception("Model chưa được load hoặc train")
         
-        processed_text = self.preprocess_text(text)
+        if not texts:
+            return []
         
-        # Predict class
-        prediction = self.pipeline.predict([processed_text])[0]
+        processed_texts = texts if preprocessed else [self.preprocess_text(text) for text in texts]
         
-        # Get probability scores
-        probabilities = self.pipeline.predict_proba([processed_text])[0]
+        if model.scorer is not None and len(processed_texts) <= self.FAST_SCORER_MAX_BATCH:
+            return [model.scorer.predict(text) for text in processed_texts]
         
-        return int(prediction), probabilities.tolist()
+        # Một lần vectorize + một lần predict_proba cho toàn bộ batch
+        probabilities = model.pipeline.predict_proba(processed_texts)
+        classes = model.pipeline.classes_
+        predictions = classes[probabilities.argmax(axis=1)]
+        
+        return [
+            (int(prediction), probs.tolist())
+            for prediction, probs in zip(predictions, probabilities)
+        ]
     
     def get_classification_name(self, prediction: int) -> str:
         """Chuyển đổi số prediction thành tên"""
         mapping = {0: 'legitimate', 1: 'suspicious', 2: 'spam'}
-        return mapping.get(prediction, 'unknown')
\ No newline at end of file
+        return mapping.get(prediction, 'unknown')
+    
+    def get_label(self, classification: str) -> int:
+        """Chuyển tên phân loại thành nhãn số (ngược với get_classification_name)"""
+        mapping = {'legitimate': 0, 'suspicious': 1, 'spam': 2}
+        return mapping[classification]
\ No newline at end of file
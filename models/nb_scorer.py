@@ -0,0 +1,104 @@
+import math
+import re
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+class NBScorer:
+    """
+    Tính trực tiếp TF-IDF + MultinomialNB cho từng message, bỏ qua lớp validate của sklearn
+
+    Với x = tfidf(message) đã chuẩn hóa L2:
+        log P(c|x) ∝ x · feature_log_prob_[c] + class_log_prior_[c]
+    Tiền tính W[j] = idf[j] * feature_log_prob_[:, j] nên mỗi message chỉ cần
+    tokenize, tra dict term → cột, một phép nhân nhỏ và softmax.
+    Chỉ hỗ trợ cấu hình vectorizer mà NaiveBayesFilter dùng (word n-gram, norm l2/None, không sublinear_tf).
+    """
+
+    def __init__(self, vocabulary: Dict[str, int], idf: np.ndarray, feature_log_prob: np.ndarray,
+                 class_log_prior: np.ndarray, classes: np.ndarray, token_pattern: str,
+                 ngram_range: Tuple[int, int], norm: str = 'l2', lowercase: bool = True):
+        if norm not in ('l2', None):
+            raise ValueError(f"Unsupported norm: {norm}")
+
+        self.vocabulary = vocabulary
+        self.idf = np.asarray(idf, dtype=np.float64)
+        # (n_features, n_classes): hàng j là đóng góp của một lần xuất hiện term j (trước khi chuẩn hóa)
+        self.weights = np.ascontiguousarray((np.asarray(feature_log_prob) * self.idf).T)
+        self.class_log_prior = np.asarray(class_log_prior, dtype=np.float64)
+        self.classes = [int(c) for c in classes]
+        self.token_re = re.compile(token_pattern)
+        self.min_n, self.max_n = ngram_range
+        self.norm = norm
+        self.lowercase = lowercase
+
+    @classmethod
+    def from_pipeline(cls, pipeline) -> 'NBScorer':
+        """Xuất scorer từ Pipeline TF-IDF + MultinomialNB đã train"""
+        vectorizer = pipeline.named_steps['tfidf']
+        nb = pipeline.named_steps['nb']
+        if vectorizer.analyzer != 'word' or vectorizer.sublinear_tf or not vectorizer.use_idf:
+            raise ValueError("NBScorer only supports word analyzer with idf and raw term frequency")
+
+        return cls(
+            vocabulary=vectorizer.vocabulary_,
+            idf=vectorizer.idf_,
+            feature_log_prob=nb.feature_log_prob_,
+            class_log_prior=nb.class_log_prior_,
+            classes=nb.classes_,
+            token_pattern=vectorizer.token_pattern,
+            ngram_range=vectorizer.ngram_range,
+            norm=vectorizer.norm,
+            lowercase=vectorizer.lowercase
+        )
+
+    def _terms(self, text: str) -> List[str]:
+        """Giống analyzer 'word' của sklearn: token theo token_pattern rồi ghép n-gram bằng dấu cách"""
+        if self.lowercase:
+            text = text.lower()
+        tokens = self.token_re.findall(text)
+        if self.max_n == 1:
+            return tokens
+
+        terms = list(tokens) if self.min_n == 1 else []
+        n_tokens = len(tokens)
+        for n in range(max(self.min_n, 2), min(self.max_n, n_tokens) + 1):
+            for start in range(n_tokens - n + 1):
+                terms.append(' '.join(tokens[start:start + n]))
+        return terms
+
+    def predict_log_proba(self, text: str) -> np.ndarray:
+        """log P(class | text) theo thứ tự classes"""
+        counts = {}
+        vocabulary = self.vocabulary
+        for term in self._terms(text):
+            index = vocabulary.get(term)
+            if index is not None:
+                counts[index] = counts.get(index, 0) + 1
+
+        joint_log_likelihood = self.class_log_prior
+        if counts:
+            indices = np.fromiter(counts.keys(), dtype=np.intp, count=len(counts))
+            term_counts = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+            scores = term_counts @ self.weights[indices]
+            if self.norm == 'l2':
+                scores /= math.sqrt(np.dot(term_counts * self.idf[indices], term_counts * self.idf[indices]))
+            joint_log_likelihood = joint_log_likelihood + scores
+
+        # logsumexp ổn định số học
+        max_score = joint_log_likelihood.max()
+        return joint_log_likelihood - (max_score + math.log(np.exp(joint_log_likelihood - max_score).sum()))
+
+    def predict(self, text: str) -> Tuple[int, List[float]]:
+        """(prediction, probability_scores) cùng format với NaiveBayesFilter.predict"""
+        probabilities = np.exp(self.predict_log_proba(text))
+        return self.classes[int(probabilities.argmax())], probabilities.tolist()
+
+    def max_abs_difference(self, pipeline, texts: List[str]) -> float:
+        """Sai khác lớn nhất giữa xác suất của scorer và pipeline.predict_proba (kiểm tra parity)"""
+        if not texts:
+            return 0.0
+        expected = pipeline.predict_proba(texts)
+        actual = np.array([np.exp(self.predict_log_proba(text)) for text in texts])
+        return float(np.abs(expected - actual).max())
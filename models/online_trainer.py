@@ -0,0 +1,83 @@
+import threading
+import time
+from typing import Dict, List
+
+
+class OnlineTrainer:
+    """
+    Học tăng dần các message admin đã review vào model Naive Bayes, chạy trong thread nền
+    Mỗi chu kỳ: lấy review chưa học (khóa ghi DB) → partial_fit → lưu artifact version mới → swap model.
+    """
+
+    def __init__(self, nb_filter, db_manager, min_batch: int = 5, max_batch: int = 500):
+        self.nb_filter = nb_filter
+        self.db = db_manager
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()  # Một lần train tại một thời điểm trong process
+
+        self.updates = 0
+        self.samples_trained = 0
+        self.last_update_at = None
+        self.last_error = None
+
+    def start(self, interval: float = 300):
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name='nb-online-trainer')
+        self._thread.daemon = True
+        self._thread.start()
+        print(f"Online NB trainer started (every {interval}s, min batch {self.min_batch})")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"❌ Error in online trainer: {e}")
+
+    def run_once(self, min_batch: int = None) -> int:
+        """Học ngay các review đang chờ (nếu đủ min_batch). Returns: số review đã học"""
+        with self._lock:
+            trained = self.db.train_on_reviews(
+                self._train,
+                limit=self.max_batch,
+                min_batch=self.min_batch if min_batch is None else min_batch
+            )
+
+        if trained:
+            self.updates += 1
+            self.samples_trained += trained
+            self.last_update_at = time.time()
+            self.last_error = None
+        return trained
+
+    def _train(self, rows: List[Dict]) -> bool:
+        # Đang giữ khóa ghi DB → trainer process khác phải chờ; học trên version mới nhất để không ghi đè nhau
+        self.nb_filter.reload_if_changed()
+        self.nb_filter.partial_fit(
+            [row['content'] for row in rows],
+            [self.nb_filter.get_label(row['reviewed_label']) for row in rows]
+        )
+        return True
+
+    def get_stats(self) -> Dict:
+        return {
+            'running': bool(self._thread and self._thread.is_alive()),
+            'updates': self.updates,
+            'samples_trained': self.samples_trained,
+            'last_update_at': self.last_update_at,
+            'last_error': self.last_error,
+            'pending_reviews': self.db.count_untrained_reviews()
+        }
@@ -0,0 +1,29 @@
+import re
+import unicodedata
+
+# Compile một lần khi import; \w+ lấy các cụm chữ/số, mọi ký tự còn lại là dấu phân cách
+_WORD_RE = re.compile(r'\w+')
+
+# đ/Đ không tách được thành d + dấu khi NFD nên phải thay riêng
+_FOLD_TABLE = str.maketrans({'đ': 'd', 'Đ': 'D'})
+
+
+def fold_diacritics(text: str) -> str:
+    """Bỏ dấu tiếng Việt: 'tài khoản' -> 'tai khoan'"""
+    decomposed = unicodedata.normalize('NFD', text.translate(_FOLD_TABLE))
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def preprocess_text(text: str, fold: bool = False) -> str:
+    """
+    Tiền xử lý dùng chung cho Naive Bayes, key của verdict cache và keyword matcher
+    - Chuẩn hóa Unicode NFC: cùng một chữ gõ dạng NFC hay NFD (tổ hợp) cho ra cùng token
+    - Chữ thường, bỏ ký tự đặc biệt, gộp khoảng trắng
+    - fold=True: bỏ dấu (dùng khi cần khớp cả văn bản gõ không dấu)
+    Kết quả giống hệt cách cũ (hai lần re.sub) với input NFC, chỉ quét regex một lượt.
+    """
+    if not text.isascii():
+        text = unicodedata.normalize('NFC', text)
+        if fold:
+            text = fold_diacritics(text)
+    return ' '.join(_WORD_RE.findall(text.lower()))
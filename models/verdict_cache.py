@@ -0,0 +1,106 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class VerdictCache:
+    """
+    Cache kết quả LLM theo hash nội dung đã tiền xử lý
+    Tầng 1: LRU trong bộ nhớ có TTL. Tầng 2 (tùy chọn): bảng llm_verdict_cache trong SQLite,
+    giữ kết quả qua các lần restart và chia sẻ giữa các process.
+    """
+    
+    # Chỉ cache các trường verdict, không cache health/error của lần gọi gốc
+    VERDICT_FIELDS = ('is_spam', 'confidence', 'reason', 'classification', 'provider')
+    
+    def __init__(self, max_entries: int = 10000, ttl_seconds: int = 86400, db_manager=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db = db_manager
+        self._entries = OrderedDict()  # key -> (stored_at, verdict)
+        self._lock = threading.Lock()
+        
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.saved_time_ms = 0.0
+    
+    @staticmethod
+    def make_key(normalized_text: str) -> str:
+        """Key = SHA-256 của văn bản đã tiền xử lý (các bản copy của cùng chiến dịch spam trùng key)"""
+        return hashlib.sha256(normalized_text.encode('utf-8')).hexdigest()
+    
+    def get(self, key: str) -> Optional[Dict]:
+        """Lấy verdict còn hạn, None nếu miss"""
+        now = time.time()
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, verdict = entry
+                if now - stored_at < self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    self.saved_time_ms += verdict.get('processing_time_ms', 0.0)
+                    return dict(verdict)
+                del self._entries[key]
+        
+        if self.db is not None:
+            row = self.db.get_cached_verdict(key, max_age_seconds=self.ttl_seconds)
+            if row is not None:
+                stored_at, verdict_json = row
+                verdict = json.loads(verdict_json)
+                with self._lock:
+                    self._store(key, stored_at, verdict)
+                    self.persistent_hits += 1
+                    self.saved_time_ms += verdict.get('processing_time_ms', 0.0)
+                return dict(verdict)
+        
+        with self._lock:
+            self.misses += 1
+        return None
+    
+    def put(self, key: str, result: Dict):
+        """Lưu verdict từ kết quả phân tích của provider"""
+        verdict = {field: result[field] for field in self.VERDICT_FIELDS if field in result}
+        verdict['processing_time_ms'] = result.get('processing_time_ms', 0.0)
+        now = time.time()
+        
+        with self._lock:
+            self._store(key, now, verdict)
+        
+        if self.db is not None:
+            try:
+                self.db.put_cached_verdict(key, json.dumps(verdict, ensure_ascii=False), now)
+            except Exception as e:
+                print(f"⚠️ Could not persist verdict cache entry: {e}")
+    
+    def _store(self, key: str, stored_at: float, verdict: Dict):
+        self._entries[key] = (stored_at, verdict)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def get_stats(self) -> Dict:
+        """Thống kê hit/miss để theo dõi chi phí và độ trễ tiết kiệm được"""
+        with self._lock:
+            hits = self.memory_hits + self.persistent_hits
+            lookups = hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': hits,
+                'memory_hits': self.memory_hits,
+                'persistent_hits': self.persistent_hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / lookups, 3) if lookups else 0.0,
+                'llm_calls_saved': hits,
+                'saved_time_ms': round(self.saved_time_ms, 1),
+                'persistent': self.db is not None
+            }
@@ -97,13 +97,13 @@ def pre_train_model():
     CẢI TIẾN: Huấn luyện trước model Naive Bayes
     """
     print_header("Huấn luyện Model Naive Bayes")
-    if os.path.exists('models/nb_model.pkl'):
+    if os.path.exists('models/nb_model/CURRENT'):
         print("✅ Model đã được huấn luyện từ trước.")
     else:
         print("⏳ Bắt đầu huấn luyện model... (việc này có thể mất vài giây)")
         try:
-            nb_filter = NaiveBayesFilter()
-            nb_filter.train_model()
+            # Constructor tự train (hoặc chuyển từ nb_model.pkl cũ) khi chưa có artifact
+            NaiveBayesFilter()
             print("✅ Model đã được huấn luyện và lưu lại.")
         except Exception as e:
             print(f"❌ Lỗi trong quá trình huấn luyện model: {e}")
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Entry point production: tách front end HTTP/SocketIO khỏi các worker process phân loại message
+
+    python serve.py web --host 0.0.0.0 --port 5000     # Flask-SocketIO trên eventlet, không xử lý message
+    python serve.py workers --workers 16               # N process: mỗi process load model một lần,
+                                                       # claim message pending từ SQLite dùng chung
+
+Hai lệnh chạy độc lập (service/container riêng) trên cùng file DB. Để worker emit 'message_processed'
+tới browser, đặt cùng SOCKETIO_MESSAGE_QUEUE (vd. redis://localhost:6379/0, cần `pip install redis`)
+cho cả hai lệnh; không đặt thì client vẫn thấy kết quả khi tải lại inbox.
+Chạy dev một process như cũ: python app.py
+"""
+
+import sys
+
+# Front end chạy trên eventlet: monkey_patch phải chạy trước mọi import khác (threading, socket, time...),
+# nếu không lock/thread tạo lúc import sẽ là thread thật và chặn event loop.
+# Worker process (spawn) import file này dưới tên __mp_main__ nên không bị patch.
+USE_EVENTLET = False
+if __name__ == '__main__' and sys.argv[1:2] == ['web']:
+    try:
+        import eventlet
+        eventlet.monkey_patch()
+        USE_EVENTLET = True
+    except ImportError:
+        pass
+
+import argparse
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Mỗi worker là một process → BLAS/OpenMP một thread, tránh 16 process × 16 thread tranh nhau core
+WORKER_THREAD_ENV = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+RESTART_DELAY = 2  # Giây chờ trước khi khởi động lại worker bị chết
+SHUTDOWN_TIMEOUT = 30  # Giây chờ worker dừng gọn (trả lease, flush log) trước khi kill
+
+
+def run_web(host: str, port: int):
+    """Front end: chỉ phục vụ HTTP/WebSocket; message mới được worker process claim từ DB"""
+    if not USE_EVENTLET:
+        print("⚠️ eventlet not installed, falling back to the Werkzeug threading server")
+
+    import app as spam_filter
+
+    spam_filter.log_writer.start()
+    # Settings/keyword rule/model do worker hoặc admin sửa được áp dụng cả ở front end
+    spam_filter.change_watcher.start()
+    if not os.environ.get('SOCKETIO_MESSAGE_QUEUE'):
+        print("⚠️ SOCKETIO_MESSAGE_QUEUE not set: workers cannot push realtime updates to clients")
+
+    # SIGTERM/SIGINT → thoát khỏi socketio.run để finally ghi nốt filter_logs còn trong buffer
+    # (kể cả log quyết định của /api/classify) thay vì mất cùng daemon thread
+    def shutdown(*_):
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    print(f"🌐 Web front end listening on {host}:{port} (pid {os.getpid()})")
+    try:
+        spam_filter.socketio.run(spam_filter.app, host=host, port=port, allow_unsafe_werkzeug=not USE_EVENTLET)
+    finally:
+        print("Stopping web front end...")
+        spam_filter.change_watcher.stop()
+        spam_filter.log_writer.stop()
+
+
+def _worker_main(index: int):
+    """Một classification worker: import app (load model, mở DB) rồi chạy MessageProcessor ở chế độ poll DB"""
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+
+    import app as spam_filter
+
+    # Online trainer và đối soát counter chỉ cần chạy ở worker đầu tiên
+    processor = spam_filter.MessageProcessor(poll_database=True, run_background_jobs=(index == 0))
+    processor.start()
+    print(f"⚙️ Worker {index} ready (pid {os.getpid()}, id {processor.worker_id})")
+
+    stop_event.wait()
+    processor.stop()
+
+
+def run_workers(worker_count: int):
+    """Supervisor: giữ đủ worker_count process, khởi động lại process chết, dừng gọn khi nhận SIGTERM/SIGINT"""
+    for name in WORKER_THREAD_ENV:
+        os.environ.setdefault(name, '1')
+
+    # Import app một lần trước khi spawn: migration DB, train/convert model, seed keyword rule
+    # → các worker chỉ load artifact đã có, không train song song
+    import app  # noqa: F401
+
+    context = multiprocessing.get_context('spawn')
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    def spawn(index: int):
+        process = context.Process(target=_worker_main, args=(index,), name=f'classifier-{index}')
+        process.start()
+        return process
+
+    workers = {index: spawn(index) for index in range(worker_count)}
+    print(f"🚀 Started {worker_count} classification workers")
+
+    while not stopping.wait(1):
+        for index, process in list(workers.items()):
+            if not process.is_alive():
+                print(f"❌ Worker {index} (pid {process.pid}) exited with code {process.exitcode}, restarting")
+                time.sleep(RESTART_DELAY)
+                workers[index] = spawn(index)
+
+    print("Stopping classification workers...")
+    for process in workers.values():
+        if process.is_alive():
+            process.terminate()
+    deadline = time.time() + SHUTDOWN_TIMEOUT
+    for process in workers.values():
+        process.join(max(0, deadline - time.time()))
+        if process.is_alive():
+            process.kill()
+    print("Classification workers stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Spam filter production entry point')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    web = subparsers.add_parser('web', help='HTTP/SocketIO front end')
+    web.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    web.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)))
+
+    workers = subparsers.add_parser('workers', help='Classification worker processes')
+    workers.add_argument('--workers', type=int, default=int(os.environ.get('CLASSIFIER_WORKERS', os.cpu_count() or 1)),
+                         help='Số worker process (mặc định: số core)')
+
+    args = parser.parse_args()
+    if args.command == 'web':
+        run_web(args.host, args.port)
+    else:
+        run_workers(max(1, args.workers))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,8 @@ class SpamFilterApp {
     constructor() {
         this.socket = null;
         this.currentTab = 'inbox';
+        // Cursor trang kế tiếp của từng tab (header X-Next-Cursor), null = đã hết
+        this.nextCursors = {};
         this.testMessages = {
             legitimate: [
                 "Xin chào, tôi muốn hỏi về sản phẩm của công ty",
@@ -139,14 +141,16 @@ class SpamFilterApp {
         }
     }
 
-    renderMessages(messages, containerId, isAdmin = false) {
+    renderMessages(messages, containerId, isAdmin = false, append = false, onLoadMore = null) {
         const container = document.getElementById(containerId);
-        if (!messages || messages.length === 0) {
+        const loadMoreButton = container.querySelector('.load-more');
+        if (loadMoreButton) loadMoreButton.remove();
+        if (!append && (!messages || messages.length === 0)) {
             container.innerHTML = '<p class="empty-state">No messages found...</p>';
             return;
         }
         
-        container.innerHTML = messages.map(msg => `
+        const html = messages.map(msg => `
             <div class="message-item ${msg.classification || ''}">
                 <div class="message-header">
                     <span class="message-sender">${this.escapeHtml(msg.sender)}</span>
@@ -165,6 +169,20 @@ class SpamFilterApp {
                 ` : ''}
             </div>
         `).join('');
+        if (append) {
+            container.insertAdjacentHTML('beforeend', html);
+        } else {
+            container.innerHTML = html;
+        }
+        
+        // API chỉ trả một trang (mặc định 50 dòng mới nhất) → nút tải trang kế tiếp theo cursor
+        if (onLoadMore) {
+            container.insertAdjacentHTML('beforeend', '<button class="btn btn-secondary load-more">Load more</button>');
+            container.querySelector('.load-more').addEventListener('click', (event) => {
+                event.target.disabled = true;
+                onLoadMore();
+            });
+        }
     }
 
     // PHẦN 3: TƯƠNG TÁC VỚI API
@@ -206,7 +224,7 @@ class SpamFilterApp {
         this.sendMessage();
     }
     
-    async loadTabData(tabName) {
+    async loadTabData(tabName, loadMore = false) {
         const endpoints = {
             inbox: '/api/inbox?status=approved',
             flagged: '/api/inbox?status=flagged',
@@ -222,10 +240,20 @@ class SpamFilterApp {
 
         if (!endpoints[tabName]) return;
 
+        let url = endpoints[tabName];
+        if (loadMore) {
+            if (!this.nextCursors[tabName]) return;
+            url += `${url.includes('?') ? '&' : '?'}cursor=${encodeURIComponent(this.nextCursors[tabName])}`;
+        }
+
         try {
-            const response = await fetch(endpoints[tabName]);
+            const response = await fetch(url);
             const data = await response.json();
-            this.renderMessages(data, containerIds[tabName], tabName === 'admin');
+            this.nextCursors[tabName] = response.headers.get('X-Next-Cursor');
+            this.renderMessages(
+                data, containerIds[tabName], tabName === 'admin', loadMore,
+                this.nextCursors[tabName] ? () => this.loadTabData(tabName, true) : null
+            );
         } catch (error) {
             this.showToast(`Failed to load ${tabName} data`, 'error');
         }
@@ -382,9 +410,11 @@ class SpamFilterApp {
     }
     
     exportLogs() {
-        fetch('/api/admin/messages')
-            .then(res => res.json())
-            .then(data => {
+        // Export toàn bộ dạng NDJSON stream thay vì chỉ trang đầu
+        fetch('/api/admin/messages?format=ndjson&limit=500')
+            .then(res => res.text())
+            .then(text => {
+                const data = text.split('\n').filter(line => line.trim()).map(line => JSON.parse(line));
                 const headers = ['id', 'content', 'sender', 'status', 'classification', 'created_at', 'filter_history'];
                 const rows = data.map(item => headers.map(header => `"${(item[header] || '').toString().replace(/"/g, '""')}"`).join(','));
                 const csv = [headers.join(','), ...rows].join('\n');